@@ -1,66 +1,310 @@
+import hashlib
+import os
 import re
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from typing import List, Optional
-import textract
 from bs4 import BeautifulSoup
-import PyPDF2
+from docx import Document as DocxDocument
+from lxml import etree
+import pymupdf
 from models.schemas import LegalDocument, DocumentChunk
-from utils.logger import logger
-from datetime import datetime
+from utils.logger import logger, setup_worker_logging, get_log_queue
+from utils.system import available_cpu_count
+from datetime import date
+
+try:
+    import re2
+except ImportError:
+    re2 = None
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+
+def _compile_fast(pattern: str):
+    """Компиляция шаблона в RE2 (линейное время), если модуль установлен и поддерживает шаблон"""
+    if re2 is not None:
+        try:
+            return re2.compile(pattern)
+        except re2.error:
+            pass
+    return re.compile(pattern)
+
+
+def _build_keyword_automaton(terms) -> Optional['ahocorasick.Automaton']:
+    """Автомат Ахо-Корасик для поиска всех терминов за один проход по тексту"""
+    if ahocorasick is None:
+        return None
+    automaton = ahocorasick.Automaton()
+    # Значение - (приоритет, термин): приоритет = позиция термина в списке, как у альтернации в регулярном выражении
+    for priority, term in enumerate(terms):
+        automaton.add_word(term, (priority, term))
+    automaton.make_automaton()
+    return automaton
+
+# Шаблоны предварительной очистки юридического текста (LegalTextProcessor._preprocess_text)
+_RE_NEWLINE = re.compile(r'\r\n|\r|\n')
+_RE_JOIN_BROKEN = re.compile(r'([^\n])\n([^\n])')
+# Технические разделители '--' удаляются регулярным выражением,
+# посимвольные замены выполняются таблицей str.translate
+_RE_DASHES = re.compile(r'--+')
+_CHAR_FIX = str.maketrans({
+    '\f': '\n',  # form feed -> новая строка
+    '\v': '\n',  # vertical tab -> новая строка
+    '\xad': '',  # мягкий перенос
+    '\xa0': ' ',  # неразрывный пробел
+    '\u201c': '"',  # типографские кавычки
+    '\u201d': '"',
+    '\u201e': '"',
+})
+_RE_CONSULT = re.compile(
+    r'(?:Документ предоставлен|Дата сохранения|КонсультантПлюс|www\.consultant\.ru).*?\n',
+    re.DOTALL | re.IGNORECASE
+)
+_RE_DOC_DATE_LINE = re.compile(r'\d{1,2}\s+[а-яА-Я]+\s+\d{4}\s+года\s+[NН]\s+\d+(?:-[А-Я]+)?\s*\n')
+_RE_ARTICLE_DOT = re.compile(r'(Статья\s+\d+)\s*\.')
+_RE_HEADING_BREAK = re.compile(r'([^\n])(Раздел|Глава|Подраздел|Статья)')
+_RE_WHITESPACE = re.compile(r'\s+')
+_RE_STRUCT_BREAK = re.compile(r' (?=Статья\s+\d|Раздел|Глава|Подраздел)')
+_RE_ITEM_BREAK = re.compile(r'(?<=\.)(\d+)\.\s+')
+
+# Метаданные документа (DocumentProcessor._extract_document_metadata)
+_RE_DOC_TITLE = re.compile(r'"(.*?)"\s+от\s+(\d{2}\.\d{2}\.\d{4})')
+_RE_DOC_EDITION = re.compile(r'ред\. от (\d{2}\.\d{2}\.\d{4})')
+
+# Метаданные юридического текста (LegalTextProcessor._extract_document_metadata)
+_RE_LEGAL_TITLE = re.compile(r'"([^"]+)"\s+от\s+(\d{2}\.\d{2}\.\d{4})')
+_RE_LEGAL_CODEX = re.compile(r'ГРАЖДАНСКИЙ\s+КОДЕКС|Гражданский\s+кодекс')
+_RE_LEGAL_FEDERAL_LAW = re.compile(r'ФЕДЕРАЛЬНЫЙ\s+ЗАКОН|Федеральный\s+закон')
+# Тип документа указывается в шапке, поэтому он ищется только в начале текста
+_DOC_TYPE_WINDOW = 4096
+_RE_LEGAL_DOC_NUMBER = re.compile(r'[NН]\s+(\d+(?:-\w+)?)')
+_RE_LEGAL_EDITION = re.compile(r'ред\.\s+от\s+(\d{2}\.\d{2}\.\d{4})')
+
+# Упоминания других нормативных актов (DocumentProcessor.extract_document_citations)
+_CITATION_PATTERNS = tuple(
+    (re.compile(pattern, re.IGNORECASE), doc_type)
+    for pattern, doc_type in (
+        (r'(?:Федеральн(?:ый|ого|ому) закон(?:а|у|ом)?)\s+"([^"]+)"\s+от\s+(\d{1,2}\.\d{1,2}\.\d{4})\s+[NН]\s+(\d+-[А-Я]+)',
+         'federal_law'),
+        (r'([А-Я][а-я]+(?:ом|ого|ий|ый))\s+кодекс(?:а|е|ом|у)?\s+Российской\s+Федерации',
+         'codex'),
+        (r'Постановлени(?:е|я|ю|ем)\s+Правительства\s+Российской\s+Федерации\s+от\s+(\d{1,2}\.\d{1,2}\.\d{4})\s+[NН]\s+(\d+)',
+         'government_decree'),
+        (r'Приказ(?:а|е|ом|у)?\s+(?:Министерства|Минфина|Минюста|ФНС)[^"]*\s+от\s+(\d{1,2}\.\d{1,2}\.\d{4})\s+[NН]\s+(\d+)',
+         'ministry_order'),
+    )
+)
+
+# Глобальные inline-флаги в начале шаблона, например '(?m)^\s*\d+\s*$'
+_RE_INLINE_FLAGS = re.compile(r'^\(\?([aiLmsux]+)\)')
+
+
+def _combine_clean_patterns(patterns: List[str]) -> Optional[re.Pattern]:
+    """Объединяет шаблоны удаления в одну альтернацию для очистки за один проход"""
+    if not patterns:
+        return None
+    
+    parts = []
+    for pattern in patterns:
+        # Глобальные флаги допустимы только в начале выражения,
+        # поэтому внутри альтернации они переносятся в локальную группу (?m:...)
+        flags_match = _RE_INLINE_FLAGS.match(pattern)
+        if flags_match:
+            parts.append(f"(?{flags_match.group(1)}:{pattern[flags_match.end():]})")
+        else:
+            parts.append(f"(?:{pattern})")
+    
+    try:
+        return re.compile('|'.join(parts))
+    except re.error as e:
+        logger.warning(f"Could not combine clean patterns, falling back to sequential cleanup: {e}")
+        return None
+
+
+def _iter_fragments(content: str, max_size: int):
+    """Лениво нарезает текст на фрагменты до max_size символов, возвращая (offset, text)"""
+    length = len(content)
+    start = 0
+    while start < length:
+        end = min(start + max_size, length)
+        if end < length:
+            # Разрыв по последнему переносу строки во второй половине окна,
+            # чтобы не резать абзац посередине; иначе - жесткий разрез по размеру
+            newline = content.rfind('\n', start + max_size // 2, end)
+            if newline != -1:
+                end = newline + 1
+        yield start, content[start:end]
+        start = end
+
+
+def _document_id(file_path: Path) -> str:
+    """Детерминированный идентификатор документа по абсолютному пути файла"""
+    digest = hashlib.blake2b(str(file_path.resolve()).encode('utf-8'), digest_size=8).hexdigest()
+    return f"doc_{digest}_{file_path.stem}"
+
+
+def _parse_date(value: str) -> date:
+    """Разбор даты формата DD.MM.YYYY срезами строки, без strptime"""
+    return date(int(value[6:10]), int(value[3:5]), int(value[0:2]))
+
+
+def _decode_bytes(data: bytes) -> str:
+    """Декодирование содержимого файла: сначала cp1251, при ошибке - utf-8 с заменой символов"""
+    try:
+        return data.decode('cp1251')
+    except UnicodeDecodeError:
+        return data.decode('utf-8', errors='replace')
+
+# Тип документа для process_document по расширению файла; остальные файлы считаются юридическим текстом
+DOC_TYPES_BY_SUFFIX = {
+    '.pdf': 'pdf',
+    '.html': 'html',
+    '.xml': 'html',
+}
+
+
+def collect_files(directory_path: Path, extensions: List[str]) -> List[str]:
+    """Файлы директории с нужными расширениями, от крупных к мелким"""
+    # Один проход по директории вместо отдельного glob на каждое расширение;
+    # крупные файлы ставятся в начало (LPT), чтобы тяжелые PDF не оставались в хвосте пула,
+    # при равном размере порядок определяется путем и воспроизводим между запусками
+    suffixes = {ext.lower() for ext in extensions}
+    with os.scandir(directory_path) as entries:
+        sized_files = sorted(
+            (-entry.stat().st_size, entry.path) for entry in entries
+            if entry.is_file() and os.path.splitext(entry.name)[1].lower() in suffixes
+        )
+    return [path for _, path in sized_files]
+
+# Теги, из которых собирается структура HTML/XML, и служебные теги, исключаемые из текста
+_HTML_STRUCTURE_TAGS = ('h1', 'h2', 'h3', 'article', 'section')
+_HTML_NOISE_TAGS = ('script', 'style', 'header', 'footer')
 
 class DocumentProcessor:    
     def __init__(self, clean_patterns: List[str]):
         self.clean_patterns = [re.compile(p) for p in clean_patterns]
+        self._combined_clean = _combine_clean_patterns(clean_patterns)
         self.legal_processor = LegalTextProcessor(clean_patterns)
-        self.document_counter = 0
+        # Специализированные обработчики по расширению; остальные форматы (.doc и др.) идут через textract
+        self._handlers = {
+            '.pdf': self._process_pdf,
+            '.docx': self._process_docx,
+            '.txt': self._process_txt,
+            '.html': self._process_html_xml,
+            '.xml': self._process_html_xml,
+        }
 
     def _clean_text(self, text: str) -> str:
         """Очистка текста от шумов с использованием регулярных выражений"""
+        if self._combined_clean is not None:
+            return self._combined_clean.sub('', text).strip()
+        
         for pattern in self.clean_patterns:
             text = pattern.sub('', text)
         return text.strip()
 
     def _process_pdf(self, file_path: Path) -> str:
-        text = ""
-        with open(file_path, 'rb') as f:
-            reader = PyPDF2.PdfReader(f)
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-        return self._clean_text(text)
+        parts = []
+        with pymupdf.open(file_path) as doc:
+            for page in doc:
+                parts.append(page.get_text("text") or "")
+        return self._clean_text("\n".join(parts))
+
+    def _process_docx(self, file_path: Path) -> str:
+        document = DocxDocument(str(file_path))
+        return self._clean_text('\n'.join(paragraph.text for paragraph in document.paragraphs))
+
+    def _process_txt(self, file_path: Path) -> str:
+        return self._clean_text(_decode_bytes(file_path.read_bytes()))
+
+    def _process_with_textract(self, file_path: Path) -> str:
+        """Извлечение текста через textract для форматов без собственного обработчика (.doc и др.)"""
+        # textract запускает внешние утилиты, поэтому импортируется только при необходимости
+        import textract
+        return self._clean_text(_decode_bytes(textract.process(str(file_path))))
 
     def _process_html_xml(self, file_path: Path) -> str:
+        try:
+            structure = self._stream_html_structure(file_path)
+        except (etree.LxmlError, ValueError) as e:
+            logger.warning(f"Streaming parse failed for {file_path}, falling back to BeautifulSoup: {e}")
+            structure = self._soup_html_structure(file_path)
+        logger.info(f"Read HTML/XML file {file_path} with cp1251 encoding")
+            
+        return self._clean_text('\n'.join(structure))
+
+    def _stream_html_structure(self, file_path: Path) -> List[str]:
+        """Потоковый разбор HTML/XML: собирает текст структурных тегов, не удерживая весь DOM"""
+        structure = []
+        open_slots = []
+        noise_depth = 0
+        events = etree.iterparse(
+            str(file_path),
+            events=('start', 'end'),
+            tag=_HTML_STRUCTURE_TAGS + _HTML_NOISE_TAGS,
+            html=True,
+            encoding='cp1251'
+        )
+        for event, elem in events:
+            if elem.tag in _HTML_NOISE_TAGS:
+                if event == 'start':
+                    noise_depth += 1
+                else:
+                    noise_depth -= 1
+                    # Аналог decompose(): текст служебного тега не попадает в родителей
+                    elem.clear(keep_tail=True)
+                continue
+            
+            if noise_depth:
+                continue
+            
+            if event == 'start':
+                # Резервируем позицию, чтобы сохранить порядок тегов в документе
+                open_slots.append(len(structure))
+                structure.append('')
+                continue
+            
+            structure[open_slots.pop()] = ' '.join(
+                part.strip() for part in elem.itertext() if part.strip()
+            )
+            
+            # Текст вложенного тега еще нужен внешнему структурному тегу
+            if not open_slots:
+                elem.clear(keep_tail=True)
+                while elem.getprevious() is not None:
+                    del elem.getparent()[0]
+        
+        return structure
+
+    def _soup_html_structure(self, file_path: Path) -> List[str]:
+        """Разбор HTML/XML целиком через BeautifulSoup"""
         with open(file_path, 'r', encoding='cp1251') as f:
             soup = BeautifulSoup(f, 'lxml')
-        logger.info(f"Read HTML/XML file {file_path} with cp1251 encoding")
             
-        for elem in soup(['script', 'style', 'header', 'footer']):
+        for elem in soup(_HTML_NOISE_TAGS):
             elem.decompose()
             
         structure = []
-        for tag in soup.find_all(['h1', 'h2', 'h3', 'article', 'section']):
+        for tag in soup.find_all(_HTML_STRUCTURE_TAGS):
             structure.append(tag.get_text(strip=True, separator=' '))
             
-        return self._clean_text('\n'.join(structure))
+        return structure
 
     def process_document(self, file_path: Path, doc_type: str = 'legal-txt') -> Optional[LegalDocument]:
         try:
-            self.document_counter += 1
-            document_id = f"doc_{self.document_counter}_{file_path.stem}"
+            document_id = _document_id(file_path)
             
-            if doc_type == 'legal-txt' and file_path.suffix.lower() == '.txt':
+            suffix = file_path.suffix.lower()
+            if doc_type == 'legal-txt' and suffix == '.txt':
                 return self._process_legal_txt(file_path, document_id)
-            elif file_path.suffix.lower() == '.pdf':
-                content = self._process_pdf(file_path)
-                return self._create_document(file_path, content, document_id)
-            elif file_path.suffix.lower() in ('.html', '.xml'):
-                content = self._process_html_xml(file_path)
-                return self._create_document(file_path, content, document_id)
-            else:
-                try:
-                    content = textract.process(str(file_path)).decode('cp1251', errors='replace')
-                except UnicodeDecodeError:
-                    content = textract.process(str(file_path)).decode('utf-8', errors='replace')
-                return self._create_document(file_path, content, document_id)
+            
+            handler = self._handlers.get(suffix, self._process_with_textract)
+            content = handler(file_path)
+            return self._create_document(file_path, content, document_id)
             
         except Exception as e:
             logger.error(f"Error processing {file_path}: {str(e)}", exc_info=True)
@@ -69,22 +313,22 @@ class DocumentProcessor:
     def _create_document(self, file_path: Path, content: str, document_id: str) -> LegalDocument:
         metadata = self._extract_document_metadata(content)
         
-        chunks = []
         max_chunk_size = 1000
-        
-        for i in range(0, len(content), max_chunk_size):
-            chunk_text = content[i:i+max_chunk_size]
-            chunks.append(DocumentChunk(
+        chunks = [
+            DocumentChunk(
                 document_id=document_id,
-                chunk_number=i//max_chunk_size + 1,
+                chunk_number=chunk_number,
                 text=chunk_text,
                 metadata={
                     'type': 'text_fragment',
                     'title': metadata.get('title', ''),
                     'doc_type': metadata.get('type', 'unknown'),
-                    'offset': i
+                    'offset': offset
                 }
-            ))
+            )
+            for chunk_number, (offset, chunk_text)
+            in enumerate(_iter_fragments(content, max_chunk_size), start=1)
+        ]
         
         return LegalDocument(
             file_path=str(file_path),
@@ -96,16 +340,12 @@ class DocumentProcessor:
 
     def _process_legal_txt(self, file_path: Path, document_id: str) -> LegalDocument:
         """Специфичная обработка юридических текстовых файлов в кодировке cp1251"""
-        try:
-            with open(file_path, 'r', encoding='cp1251') as f:
-                raw_content = f.read()
-            logger.info(f"Read file {file_path} with cp1251 encoding")
-        except UnicodeDecodeError:
-            logger.warning(f"Failed to read with cp1251, trying utf-8 as fallback for {file_path}")
-            with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
-                raw_content = f.read()
-        
-        chunks = self.legal_processor.process_legal_text(raw_content)
+        # Файл читается один раз, при неудаче cp1251 повторно декодируются уже прочитанные байты.
+        # Переносы строк приводятся к '\n', как это делал текстовый режим open()
+        raw_content = _decode_bytes(file_path.read_bytes()).replace('\r\n', '\n').replace('\r', '\n')
+        logger.info(f"Read file {file_path}")
+        
+        chunks = self.legal_processor.process_legal_text(raw_content, document_id)
         logger.info(f"Generated {len(chunks)} chunks from {file_path}")
         
         metadata = self._extract_document_metadata(raw_content)
@@ -122,45 +362,35 @@ class DocumentProcessor:
         """Извлечение метаданных из текста документа"""
         metadata = {}
         
-        title_match = re.search(
-            r'"(.*?)"\s+от\s+(\d{2}\.\d{2}\.\d{4})', 
-            text
-        )
+        title_match = _RE_DOC_TITLE.search(text)
         if title_match:
             metadata['title'] = title_match.group(1)
             try:
-                metadata['adoption_date'] = datetime.strptime(
-                    title_match.group(2), 
-                    '%d.%m.%Y'
-                ).date()
+                metadata['adoption_date'] = _parse_date(title_match.group(2))
             except ValueError:
                 logger.warning(f"Could not parse date from: {title_match.group(2)}")
         
-        if 'Гражданский кодекс' in text:
+        header = text[:_DOC_TYPE_WINDOW]
+        if 'Гражданский кодекс' in header:
             metadata['type'] = 'codex'
-        elif 'Федеральный закон' in text:
+        elif 'Федеральный закон' in header:
             metadata['type'] = 'federal_law'
         else:
             #TODO: Добавить другие типы документов
             pass
         
-        edition_match = re.search(
-            r'ред\. от (\d{2}\.\d{2}\.\d{4})', 
-            text
-        )
+        edition_match = _RE_DOC_EDITION.search(text)
         if edition_match:
             try:
-                metadata['last_edition'] = datetime.strptime(
-                    edition_match.group(1), 
-                    '%d.%m.%Y'
-                ).date()
+                metadata['last_edition'] = _parse_date(edition_match.group(1))
             except ValueError:
                 logger.warning(f"Could not parse edition date from: {edition_match.group(1)}")
         
         return metadata
 
-    def batch_process_documents(self, directory_path: Path, extensions: List[str] = None) -> dict:
-        """Пакетная обработка документов из указанной директории"""
+    def batch_process_documents(self, directory_path: Path, extensions: List[str] = None,
+                                max_workers: Optional[int] = None) -> dict:
+        """Пакетная обработка документов из указанной директории в пуле процессов"""
         if not directory_path.exists() or not directory_path.is_dir():
             logger.error(f"Directory {directory_path} does not exist or is not a directory")
             raise ValueError(f"Invalid directory path: {directory_path}")
@@ -176,36 +406,29 @@ class DocumentProcessor:
             'total_chunks': 0
         }
         
-        files_to_process = []
-        for extension in extensions:
-            files_to_process.extend(directory_path.glob(f"*{extension}"))
-        
-        for file_path in files_to_process:
-            logger.info(f"Processing file: {file_path}")
-            try:
-                doc_type = 'legal-txt'
-                if file_path.suffix.lower() == '.pdf':
-                    doc_type = 'pdf'
-                elif file_path.suffix.lower() in ['.html', '.xml']:
-                    doc_type = 'html'
-                
-                document = self.process_document(file_path, doc_type)
-                
-                if document:
+        files_to_process = collect_files(directory_path, extensions)
+        
+        # Каждый файл обрабатывается независимо, поэтому воркеры собирают
+        # собственный DocumentProcessor и возвращают только итоговые счетчики
+        clean_patterns = [pattern.pattern for pattern in self.clean_patterns]
+        workers = max_workers or available_cpu_count()
+        chunksize = max(1, len(files_to_process) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=_init_worker,
+                                 initargs=(clean_patterns, get_log_queue())) as executor:
+            results = executor.map(_process_one, files_to_process, chunksize=chunksize)
+            for doc_type, n_chunks, status in results:
+                if status == 'processed':
                     stats['processed_files'] += 1
                     
-                    doc_type = document.doc_type
                     if doc_type in stats['document_types']:
                         stats['document_types'][doc_type] += 1
                     else:
                         stats['document_types'][doc_type] = 1
                     
-                    stats['total_chunks'] += len(document.content)
+                    stats['total_chunks'] += n_chunks
                 else:
                     stats['failed_files'] += 1
-            except Exception as e:
-                logger.error(f"Error processing file {file_path}: {str(e)}", exc_info=True)
-                stats['failed_files'] += 1
         
         logger.info(f"Batch processing completed. Processed: {stats['processed_files']} files, "
                    f"Failed: {stats['failed_files']} files, "
@@ -217,23 +440,8 @@ class DocumentProcessor:
         """Извлекает упоминания других нормативных актов в документе"""
         citations = []
         
-        patterns = [
-            (r'(?:Федеральн(?:ый|ого|ому) закон(?:а|у|ом)?)\s+"([^"]+)"\s+от\s+(\d{1,2}\.\d{1,2}\.\d{4})\s+[NН]\s+(\d+-[А-Я]+)',
-             'federal_law'),
-            
-            (r'([А-Я][а-я]+(?:ом|ого|ий|ый))\s+кодекс(?:а|е|ом|у)?\s+Российской\s+Федерации', 
-             'codex'),
-            
-            (r'Постановлени(?:е|я|ю|ем)\s+Правительства\s+Российской\s+Федерации\s+от\s+(\d{1,2}\.\d{1,2}\.\d{4})\s+[NН]\s+(\d+)', 
-             'government_decree'),
-            
-            (r'Приказ(?:а|е|ом|у)?\s+(?:Министерства|Минфина|Минюста|ФНС)[^"]*\s+от\s+(\d{1,2}\.\d{1,2}\.\d{4})\s+[NН]\s+(\d+)', 
-             'ministry_order')
-        ]
-        
-        for pattern, doc_type in patterns:
-            matches = re.finditer(pattern, content, re.IGNORECASE)
-            for match in matches:
+        for pattern, doc_type in _CITATION_PATTERNS:
+            for match in pattern.finditer(content):
                 citation = {
                     'type': doc_type,
                     'match': match.group(0),
@@ -246,13 +454,13 @@ class DocumentProcessor:
 class LegalTextProcessor:
     """Обработчик текстовых документов юридического содержания"""
     
-    SECTION_PATTERN = re.compile(
-        r'(Раздел|Глава|Подраздел)\s+([IVXLCDM\d]+)?\.?\s*(.*?)(?=(?:Раздел|Глава|Подраздел|Статья)\s+|$)',
-        re.DOTALL | re.IGNORECASE
-    )
-    
-    ARTICLE_PATTERN = re.compile(
-        r'(Статья\s+\d+(?:[\.\d]*))\.\s*(.*?)(?=(?:Статья\s+\d+|Раздел|Глава|Подраздел|$))', 
+    # Разделы и статьи разбираются одним проходом по тексту: альтернативы не пересекаются,
+    # так как каждая заканчивается перед началом любой другой
+    STRUCTURE_PATTERN = re.compile(
+        r'(?P<section>(?P<section_type>Раздел|Глава|Подраздел)\s+(?P<section_number>[IVXLCDM\d]+)?\.?\s*'
+        r'(?P<section_title>.*?)(?=(?:Раздел|Глава|Подраздел|Статья)\s+|$))'
+        r'|(?P<article>(?P<article_number>Статья\s+\d+(?:[\.\d]*))\.\s*'
+        r'(?P<article_content>.*?)(?=(?:Статья\s+\d+|Раздел|Глава|Подраздел|$)))',
         re.DOTALL | re.IGNORECASE
     )
     
@@ -266,16 +474,31 @@ class LegalTextProcessor:
         re.DOTALL
     )
 
+    # Ключевые термины статей (литералы в нижнем регистре). Ищутся автоматом
+    # Ахо-Корасик за один проход; без pyahocorasick - альтернацией RE2/re
+    _KEYWORD_TERMS = (
+        'обязательство', 'договор', 'право', 'ответственность', 'сделка',
+        'иск', 'возмещение', 'ущерб', 'закон', 'кодекс', 'ст.', 'п.',
+        'собственность', 'имущество', 'наследство', 'наследование',
+        'обязательств', 'защита', 'компенсация', 'регулирование', 'владение',
+        'правоотношения', 'субъект', 'объект', 'правонарушение',
+        'дееспособность', 'правоспособность', 'представительство',
+        'исковая давность', 'сервитут', 'залог'
+    )
+    _KEYWORD_AUTOMATON = _build_keyword_automaton(_KEYWORD_TERMS)
+    _KEYWORD_RE = _compile_fast('(?i)' + '|'.join(re.escape(term) for term in _KEYWORD_TERMS))
+
     def __init__(self, clean_patterns: list[str]):
         self.clean_patterns = [re.compile(p) for p in clean_patterns]
         self.line_number_pattern = re.compile(r'^\s*\d+\|', re.MULTILINE)
-        self.document_counter = 0
 
-    def process_legal_text(self, content: str) -> list[DocumentChunk]:
+    def process_legal_text(self, content: str, document_id: Optional[str] = None) -> list[DocumentChunk]:
         """Основной метод обработки юридического текста"""
+        if document_id is None:
+            # Без пути к файлу идентификатор выводится из содержимого
+            digest = hashlib.blake2b(content.encode('utf-8'), digest_size=8).hexdigest()
+            document_id = f"doc_{digest}"
         content = self._preprocess_text(content)
-        self.document_counter += 1
-        document_id = f"doc_{self.document_counter}"
         return self._structure_document(content, document_id)
 
     def _preprocess_text(self, text: str) -> str:
@@ -284,49 +507,33 @@ class LegalTextProcessor:
         text = self.line_number_pattern.sub('', text)
         
         # Нормализация переносов строк и пробелов
-        text = re.sub(r'\r\n|\r|\n', '\n', text)  # Нормализация переносов строк
-        text = re.sub(r'([^\n])\n([^\n])', r'\1 \2', text)  # Объединение разорванных строк
-        
-        # Очистка заголовков от нумерации страниц и технических разделителей
-        text = re.sub(r'--+', '', text)
-        text = re.sub(r'\f|\v', '\n', text)  # Замена form feed и vertical tab на новую строку
+        text = _RE_NEWLINE.sub('\n', text)  # Нормализация переносов строк
+        text = _RE_JOIN_BROKEN.sub(r'\1 \2', text)  # Объединение разорванных строк
         
-        # Очистка специфичных символов
-        text = re.sub(r'\xad', '', text)  # Удаление мягких переносов
-        text = re.sub(r'\xa0', ' ', text)  # Замена неразрывных пробелов
-        text = re.sub(r'["""]', '"', text)  # Нормализация кавычек
+        # Очистка технических разделителей и специфичных символов:
+        # form feed/vertical tab, мягкие переносы, неразрывные пробелы, кавычки
+        text = _RE_DASHES.sub('', text)
+        text = text.translate(_CHAR_FIX)
         
         # Удаление технической информации о документе
-        text = re.sub(
-            r'(?:Документ предоставлен|Дата сохранения|КонсультантПлюс|www\.consultant\.ru).*?\n',
-            '', 
-            text, 
-            flags=re.DOTALL | re.IGNORECASE
-        )
+        text = _RE_CONSULT.sub('', text)
         
         # Удаление информации о дате создания документа
-        text = re.sub(
-            r'\d{1,2}\s+[а-яА-Я]+\s+\d{4}\s+года\s+[NН]\s+\d+(?:-[А-Я]+)?\s*\n',
-            '', 
-            text
-        )
+        text = _RE_DOC_DATE_LINE.sub('', text)
         
         # Очистка префиксов статей для лучшего соответствия шаблонам
-        text = re.sub(r'(Статья\s+\d+)\s*\.', r'\1.', text)
+        text = _RE_ARTICLE_DOT.sub(r'\1.', text)
         
         # Обеспечиваем отступы перед заголовками разделов и статей
-        text = re.sub(r'([^\n])(Раздел|Глава|Подраздел|Статья)', r'\1\n\2', text)
+        text = _RE_HEADING_BREAK.sub(r'\1\n\2', text)
         
         # Нормализация пробелов (убираем множественные пробелы)
-        text = re.sub(r'\s+', ' ', text)
+        text = _RE_WHITESPACE.sub(' ', text)
         
-        # Восстановление переносов строк для структурных элементов
-        text = re.sub(r' (?=Статья\s+\d|Раздел|Глава|Подраздел)', '\n', text)
-        text = re.sub(r'(?<=\.)(\d+)\.\s+', r'.\n\1. ', text)  # Разделение пунктов
-        
-        # Двойной перенос перед разделами и статьями для лучшего разделения
-        text = re.sub(r'\n(Раздел|Глава|Подраздел)', r'\n\n\1', text)
-        text = re.sub(r'\n(Статья\s+\d)', r'\n\n\1', text)
+        # Восстановление переносов строк для структурных элементов:
+        # двойной перенос перед разделами и статьями для лучшего разделения
+        text = _RE_STRUCT_BREAK.sub('\n\n', text)
+        text = _RE_ITEM_BREAK.sub(r'.\n\1. ', text)  # Разделение пунктов
         
         text = text.strip()
         
@@ -340,87 +547,81 @@ class LegalTextProcessor:
         
         doc_metadata = self._extract_document_metadata(text)
         
-        for section_match in self.SECTION_PATTERN.finditer(text):
+        for match in self.STRUCTURE_PATTERN.finditer(text):
+            if match.lastgroup == 'section':
+                try:
+                    section_type = match.group('section_type').strip()
+                    section_number = (match.group('section_number') or '').strip()
+                    section_title = match.group('section_title').strip()
+                    section_text = match.group(0).strip()
+                    
+                    chunk_counter += 1
+                    current_section = {
+                        'type': section_type,
+                        'number': section_number,
+                        'title': section_title
+                    }
+                    
+                    chunks.append(DocumentChunk(
+                        document_id=document_id,
+                        chunk_number=chunk_counter,
+                        text=section_text,
+                        metadata={
+                            'type': 'section',
+                            'section_type': section_type,
+                            'section_number': section_number,
+                            'title': section_title,
+                            'doc_title': doc_metadata.get('title', ''),
+                            'doc_date': doc_metadata.get('adoption_date', '')
+                        }
+                    ))
+                    logger.debug("Created section chunk: %s %s", section_type, section_number)
+                except Exception as e:
+                    logger.warning(f"Error processing section: {e}", exc_info=True)
+                continue
+            
             try:
-                groups = section_match.groups()
-                logger.debug(f"Section match groups: {groups}")
+                article_number = match.group('article_number').strip()
+                article_content = match.group('article_content').strip()
+                article_text = match.group(0).strip()
                 
-                section_type = groups[0].strip()
-                section_number = groups[1].strip() if groups[1] else ''
-                section_title = groups[2].strip()
-                section_text = section_match.group(0).strip()
+                # Извлечение пунктов и подпунктов статьи
+                items = []
+                for item_match in self.ITEM_PATTERN.finditer(article_content):
+                    item_number = item_match.group(1).strip()
+                    item_text = item_match.group(2).strip()
+                    
+                    # Поиск подпунктов
+                    subitems = []
+                    for subitem_match in self.SUBITEM_PATTERN.finditer(item_text):
+                        subitems.append({
+                            'number': subitem_match.group(1).strip(),
+                            'text': subitem_match.group(2).strip()
+                        })
+                    
+                    items.append({
+                        'number': item_number,
+                        'text': item_text,
+                        'subitems': subitems
+                    })
                 
+                # Создание чанка для статьи; current_section - ближайший раздел перед статьей
                 chunk_counter += 1
-                current_section = {
-                    'type': section_type,
-                    'number': section_number,
-                    'title': section_title
-                }
-                
                 chunks.append(DocumentChunk(
                     document_id=document_id,
                     chunk_number=chunk_counter,
-                    text=section_text,
+                    text=article_text,
                     metadata={
-                        'type': 'section',
-                        'section_type': section_type,
-                        'section_number': section_number,
-                        'title': section_title,
+                        'type': 'article',
+                        'article_number': article_number,
+                        'items': items,
+                        'keywords': self._extract_keywords(article_text),
                         'doc_title': doc_metadata.get('title', ''),
-                        'doc_date': doc_metadata.get('adoption_date', '')
+                        'doc_date': doc_metadata.get('adoption_date', ''),
+                        'current_section': current_section
                     }
                 ))
-                logger.debug(f"Created section chunk: {section_type} {section_number}")
-            except Exception as e:
-                logger.warning(f"Error processing section: {e}", exc_info=True)
-                continue
-        
-        for article_match in self.ARTICLE_PATTERN.finditer(text):
-            try:
-                article_parts = article_match.groups()
-                
-                if len(article_parts) >= 2:
-                    article_number = article_parts[0].strip()
-                    article_content = article_parts[1].strip()
-                    article_text = article_match.group(0).strip()
-                    
-                    # Извлечение пунктов и подпунктов статьи
-                    items = []
-                    for item_match in self.ITEM_PATTERN.finditer(article_content):
-                        item_number = item_match.group(1).strip()
-                        item_text = item_match.group(2).strip()
-                        
-                        # Поиск подпунктов
-                        subitems = []
-                        for subitem_match in self.SUBITEM_PATTERN.finditer(item_text):
-                            subitems.append({
-                                'number': subitem_match.group(1).strip(),
-                                'text': subitem_match.group(2).strip()
-                            })
-                        
-                        items.append({
-                            'number': item_number,
-                            'text': item_text,
-                            'subitems': subitems
-                        })
-                    
-                    # Создание чанка для статьи
-                    chunk_counter += 1
-                    chunks.append(DocumentChunk(
-                        document_id=document_id,
-                        chunk_number=chunk_counter,
-                        text=article_text,
-                        metadata={
-                            'type': 'article',
-                            'article_number': article_number,
-                            'items': items,
-                            'keywords': self._extract_keywords(article_text),
-                            'doc_title': doc_metadata.get('title', ''),
-                            'doc_date': doc_metadata.get('adoption_date', ''),
-                            'current_section': current_section
-                        }
-                    ))
-                    logger.debug(f"Created article chunk: {article_number}")
+                logger.debug("Created article chunk: %s", article_number)
             except Exception as e:
                 logger.warning(f"Error processing article: {e}", exc_info=True)
                 continue
@@ -440,46 +641,35 @@ class LegalTextProcessor:
         """Извлечение общих метаданных документа"""
         metadata = {}
         
-        title_match = re.search(
-            r'"([^"]+)"\s+от\s+(\d{2}\.\d{2}\.\d{4})',
-            text
-        )
+        title_match = _RE_LEGAL_TITLE.search(text)
         if title_match:
             metadata['title'] = title_match.group(1).strip()
             try:
-                metadata['adoption_date'] = datetime.strptime(
-                    title_match.group(2), 
-                    '%d.%m.%Y'
-                ).date()
+                metadata['adoption_date'] = _parse_date(title_match.group(2))
             except:
                 pass
                 
-        # Определение типа документа
-        if re.search(r'ГРАЖДАНСКИЙ\s+КОДЕКС|Гражданский\s+кодекс', text):
+        # Определение типа документа: сначала дешевая проверка подстрок,
+        # регулярное выражение (переносы и лишние пробелы) - только если они не нашлись
+        header = text[:_DOC_TYPE_WINDOW]
+        if ('Гражданский кодекс' in header or 'ГРАЖДАНСКИЙ КОДЕКС' in header
+                or _RE_LEGAL_CODEX.search(header)):
             metadata['doc_type'] = 'codex'
-        elif re.search(r'ФЕДЕРАЛЬНЫЙ\s+ЗАКОН|Федеральный\s+закон', text):
+        elif ('Федеральный закон' in header or 'ФЕДЕРАЛЬНЫЙ ЗАКОН' in header
+                or _RE_LEGAL_FEDERAL_LAW.search(header)):
             metadata['doc_type'] = 'federal_law'
         else:
             #TODO: Добавить другие типы документов
             pass
         
-        doc_number_match = re.search(
-            r'[NН]\s+(\d+(?:-\w+)?)', 
-            text
-        )
+        doc_number_match = _RE_LEGAL_DOC_NUMBER.search(text)
         if doc_number_match:
             metadata['document_number'] = doc_number_match.group(1)
             
-        edition_match = re.search(
-            r'ред\.\s+от\s+(\d{2}\.\d{2}\.\d{4})', 
-            text
-        )
+        edition_match = _RE_LEGAL_EDITION.search(text)
         if edition_match:
             try:
-                metadata['last_edition'] = datetime.strptime(
-                    edition_match.group(1), 
-                    '%d.%m.%Y'
-                ).date()
+                metadata['last_edition'] = _parse_date(edition_match.group(1))
             except:
                 pass
                 
@@ -487,15 +677,44 @@ class LegalTextProcessor:
 
     def _extract_keywords(self, text: str) -> list[str]:
         """Извлечение ключевых терминов из текста"""
-        terms = [
-            r'обязательство', r'договор', r'право', r'ответственность', r'сделка', 
-            r'иск', r'возмещение', r'ущерб', r'закон', r'кодекс', r'ст\.', r'п\.',
-            r'собственность', r'имущество', r'наследство', r'наследование',
-            r'обязательств', r'защита', r'компенсация', r'регулирование', r'владение',
-            r'правоотношения', r'субъект', r'объект', r'правонарушение',
-            r'дееспособность', r'правоспособность', r'представительство',
-            r'исковая давность', r'сервитут', r'залог'
-        ]
-        pattern = '|'.join(fr'{term}' for term in terms)
-        keywords = re.findall(pattern, text, flags=re.IGNORECASE)
-        return list(set(keywords)) 
\ No newline at end of file
+        if self._KEYWORD_AUTOMATON is not None:
+            # Автомат находит и перекрывающиеся вхождения; оставляем те же, что дал бы finditer:
+            # самое левое, при равном начале - раньше стоящий в списке термин, без перекрытий
+            matches = sorted(
+                (end - len(term) + 1, priority, end, term)
+                for end, (priority, term) in self._KEYWORD_AUTOMATON.iter(text.lower())
+            )
+            keywords = set()
+            position = 0
+            for start, _, end, term in matches:
+                if start >= position:
+                    keywords.add(term)
+                    position = end + 1
+            return list(keywords)
+        return list({match.group(0).lower() for match in self._KEYWORD_RE.finditer(text)})
+
+
+_worker_processor: Optional[DocumentProcessor] = None
+
+
+def _init_worker(clean_patterns: List[str], log_queue=None):
+    """Инициализация обработчика документов в рабочем процессе пула"""
+    global _worker_processor
+    setup_worker_logging(log_queue)
+    _worker_processor = DocumentProcessor(clean_patterns)
+
+
+def _process_one(path_str: str) -> tuple:
+    """Обработка одного файла в рабочем процессе, возвращает (doc_type, n_chunks, status)"""
+    file_path = Path(path_str)
+    logger.info(f"Processing file: {file_path}")
+    try:
+        doc_type = DOC_TYPES_BY_SUFFIX.get(file_path.suffix.lower(), 'legal-txt')
+        document = _worker_processor.process_document(file_path, doc_type)
+    except Exception as e:
+        logger.error(f"Error processing file {file_path}: {str(e)}", exc_info=True)
+        return None, 0, 'failed'
+    
+    if document is None:
+        return None, 0, 'failed'
+    return document.doc_type, len(document.content), 'processed'
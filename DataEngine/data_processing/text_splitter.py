@@ -1,12 +1,18 @@
-from typing import List
+from collections import deque
+from typing import Iterable, List
 import re
 from utils.logger import logger
 from models.schemas import LegalDocument, DocumentChunk
 
+# Пункт начинается с номера после пробела (или в начале текста) и заканчивается
+# перед следующим номером вида " N. ", поэтому ссылки вроде "ст. 15.1." не дробят пункт
+_ITEM_RE = re.compile(r'(?<!\S)(\d+\.)\s+(.*?)(?=\s\d+\.\s|\Z)', re.DOTALL)
+
 class LegalTextSplitter:
     """Специализированный разделитель текста для юридических документов"""
     
     def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
+        # chunk_size и chunk_overlap задаются в символах
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
         self.sentence_endings = re.compile(r'(?<=[.!?])\s+')
@@ -39,7 +45,9 @@ class LegalTextSplitter:
         content = article.text
         sentences = self.sentence_endings.split(content)
         
-        current_chunk = []
+        # Длины предложений хранятся параллельно, чтобы не пересчитывать сумму после сброса
+        current_chunk = deque()
+        current_lengths = deque()
         current_length = 0
         
         for sentence in sentences:
@@ -49,12 +57,15 @@ class LegalTextSplitter:
             
             sentence_length = len(sentence)
             
-            if current_length + sentence_length > self.chunk_size:
+            if current_chunk and current_length + sentence_length > self.chunk_size:
                 chunks.append(self._create_chunk(current_chunk, article.metadata, article.document_id))
-                current_chunk = current_chunk[-self.chunk_overlap:]
-                current_length = sum(len(s) for s in current_chunk)
+                # В перекрытие попадают последние предложения общей длиной не более chunk_overlap
+                while current_chunk and current_length > self.chunk_overlap:
+                    current_length -= current_lengths.popleft()
+                    current_chunk.popleft()
             
             current_chunk.append(sentence)
+            current_lengths.append(sentence_length)
             current_length += sentence_length
         
         if current_chunk:
@@ -62,24 +73,25 @@ class LegalTextSplitter:
         
         return chunks
 
-    def _create_chunk(self, sentences: List[str], metadata: dict, document_id: str) -> DocumentChunk:
+    def _create_chunk(self, sentences: Iterable[str], metadata: dict, document_id: str) -> DocumentChunk:
         """Создает новый чанк с правильными метаданными и ID"""
         self.chunk_counter += 1
+        text = ' '.join(sentences)
         
         return DocumentChunk(
             document_id=document_id,
             chunk_number=self.chunk_counter,
-            text=' '.join(sentences),
+            text=text,
             metadata={
                 **metadata,
                 'chunk_type': 'article_part',
-                'items': self._extract_items(' '.join(sentences))
+                'items': self._extract_items(text)
             }
         )
 
     def _extract_items(self, text: str) -> List[dict]:
         items = []
-        for match in re.finditer(r'(\d+\.)\s+(.*?)(?=\d+\.|$)', text):
+        for match in _ITEM_RE.finditer(text):
             items.append({
                 'number': match.group(1).strip(),
                 'text': match.group(2).strip()
@@ -1,120 +1,430 @@
-from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct
-from typing import List
+from qdrant_client import QdrantClient, AsyncQdrantClient
+from qdrant_client.models import (
+    Distance, VectorParams, PointStruct, Filter, FieldCondition, MatchValue, QueryRequest,
+    ScalarQuantization, ScalarQuantizationConfig, ScalarType, OptimizersConfigDiff,
+    FilterSelector, PayloadSchemaType, SearchParams, QuantizationSearchParams
+)
+from contextlib import contextmanager
+from pathlib import Path
+from itertools import groupby
+from operator import attrgetter
+from typing import List, Optional, Tuple, Union
+import asyncio
+import os
+import tempfile
+import threading
 import time
-import hashlib
+import numpy as np
+import xxhash
 from models.schemas import DocumentChunk
 from utils.logger import logger
 
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Порог индексации Qdrant по умолчанию (КБ векторов в сегменте); восстанавливается после bulk_mode,
+# если в конфигурации коллекции порог не задан
+DEFAULT_INDEXING_THRESHOLD = 20000
+
+# Поля payload с keyword-индексом: точный поиск чанка и удаление документа по фильтру,
+# а также facet-подсчеты по типу, номеру статьи и заголовку раздела
+INDEXED_PAYLOAD_FIELDS = (
+    "metadata.original_id",
+    "metadata.document_id",
+    "metadata.type",
+    "metadata.article_number",
+    "metadata.title",
+)
+
+# Во сколько раз больше кандидатов отбирается по квантованным векторам перед rescore
+RESCORE_OVERSAMPLING = 2.0
+
+# Сколько секунд сведения о коллекции (get_collection) переиспользуются без повторного запроса
+COLLECTION_INFO_TTL = 5.0
+
+# Размер страницы scroll при получении списка ID точек (без payload и векторов)
+POINT_IDS_SCROLL_LIMIT = 100_000
+
+# Повторы upsert при ошибке: число попыток и экспоненциальная задержка (сек) с ограничением сверху
+UPSERT_ATTEMPTS = 3
+UPSERT_BACKOFF_BASE = 0.1
+UPSERT_BACKOFF_MAX = 2.0
+
+def point_ids_cache_path(host: str, port: int, collection_name: str) -> Path:
+    """Файл кэша ID точек; сервер входит в имя, чтобы одноименные коллекции разных серверов не смешивались"""
+    return Path(tempfile.gettempdir()) / f"{host}_{port}_{collection_name}.ids.msgpack"
+
+def scroll_point_ids(client: QdrantClient, collection_name: str) -> list:
+    """ID всех точек коллекции, без payload и векторов"""
+    point_ids = []
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            offset=offset,
+            limit=POINT_IDS_SCROLL_LIMIT,
+            with_payload=False,
+            with_vectors=False
+        )
+        point_ids.extend(point.id for point in points)
+        if offset is None:
+            return point_ids
+
+def load_point_ids_cache(cache_path: Path, points_count: int) -> Optional[list]:
+    """Читает сохраненный список ID, если он снят при том же числе точек в коллекции"""
+    if msgpack is None or not cache_path.exists():
+        return None
+    try:
+        cached = msgpack.unpackb(cache_path.read_bytes())
+    except Exception as e:
+        logger.warning(f"Failed to read point id cache {cache_path}: {str(e)}")
+        return None
+    if cached.get("points_count") != points_count:
+        return None
+    return cached["ids"]
+
+def save_point_ids_cache(cache_path: Path, points_count: int, point_ids: list):
+    if msgpack is None:
+        return
+    try:
+        tmp_path = cache_path.with_suffix(".tmp")
+        tmp_path.write_bytes(msgpack.packb({"points_count": points_count, "ids": point_ids}))
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        logger.warning(f"Failed to write point id cache {cache_path}: {str(e)}")
+
+def invalidate_point_ids_cache(cache_path: Path):
+    try:
+        cache_path.unlink(missing_ok=True)
+    except OSError as e:
+        logger.warning(f"Failed to remove point id cache {cache_path}: {str(e)}")
+
 class QdrantManager:
     def __init__(self, config):
-        self.client = QdrantClient(
-            host=config.host,
-            port=config.port,
-            timeout=60
-        )
+        # gRPC (protobuf поверх HTTP/2) вместо REST/JSON: векторы не сериализуются в текст;
+        # prefer_grpc: false в конфиге возвращает REST, например для старых серверов
+        self._client_kwargs = {
+            'host': config.host,
+            'port': config.port,
+            'grpc_port': config.grpc_port,
+            'prefer_grpc': config.prefer_grpc,
+            'timeout': 60
+        }
+        self.client = QdrantClient(**self._client_kwargs)
         self.collection_name = config.collection_name
         self.vector_size = config.vector_size
-        self.id_mapping = {}
+        self._point_ids = None
+        self._collection_info = None
+        self._collection_info_at = 0.0
+        self._collection_info_lock = threading.Lock()
         
         self._initialize_collection()
 
+    def create_async_client(self, pool_size: Optional[int] = None) -> AsyncQdrantClient:
+        """Асинхронный клиент с теми же параметрами подключения, что и у синхронного"""
+        if pool_size is None:
+            return AsyncQdrantClient(**self._client_kwargs)
+        return AsyncQdrantClient(**self._client_kwargs, pool_size=pool_size)
+
     def _initialize_collection(self):
         """Инициализация коллекции если не существует"""
         if not self.client.collection_exists(self.collection_name):
+            # Эмбеддинги нормализуются при генерации, поэтому скалярное произведение
+            # совпадает с косинусной близостью и не требует нормирования на запрос;
+            # int8-квантование хранит копию векторов в 4 раза компактнее для быстрого поиска
             self.client.recreate_collection(
                 collection_name=self.collection_name,
                 vectors_config=VectorParams(
                     size=self.vector_size,
-                    distance=Distance.COSINE
+                    distance=Distance.DOT,
+                    on_disk=False
+                ),
+                quantization_config=ScalarQuantization(
+                    scalar=ScalarQuantizationConfig(
+                        type=ScalarType.INT8,
+                        quantile=0.99,
+                        always_ram=True
+                    )
                 )
             )
             logger.info(f"Created new collection: {self.collection_name}")
+        
+        self._ensure_payload_indexes()
 
-    def _convert_string_id_to_numeric(self, string_id: str) -> int:
-        hash_object = hashlib.sha256(string_id.encode())
-        hex_dig = hash_object.hexdigest()
-        numeric_id = int(hex_dig[-16:], 16)        
-        self.id_mapping[numeric_id] = string_id
+    def _ensure_payload_indexes(self):
+        """Создание keyword-индексов по полям, используемым в фильтрах, если их еще нет"""
+        existing = self.client.get_collection(self.collection_name).payload_schema
+        for field_name in INDEXED_PAYLOAD_FIELDS:
+            if field_name not in existing:
+                self.client.create_payload_index(
+                    collection_name=self.collection_name,
+                    field_name=field_name,
+                    field_schema=PayloadSchemaType.KEYWORD
+                )
+                logger.info(f"Created payload index on {field_name} in {self.collection_name}")
+
+    @staticmethod
+    def _convert_string_ids_to_numeric(string_ids: List[str]) -> List[int]:
+        """64-битный xxh3 от строковых ID, обрезанный до 63 бит (неотрицательный int64)"""
+        # Хеши считаются в C (xxhash) прямо в массив uint64, маска накладывается одной векторной операцией
+        hashes = np.fromiter(
+            map(xxhash.xxh3_64_intdigest, map(str.encode, string_ids)),
+            dtype=np.uint64,
+            count=len(string_ids)
+        )
+        return (hashes & np.uint64(0x7FFFFFFFFFFFFFFF)).tolist()
+
+    def _build_ids_and_payloads(self, chunks: List[DocumentChunk]) -> Tuple[List[int], List[dict]]:
+        """Числовые ID точек и payload (текст и метаданные с исходным строковым ID и ID документа) для чанков"""
+        # Чанки одного документа идут подряд, поэтому префикс "<document_id>_" строится один раз на группу
+        string_ids = []
+        for document_id, group in groupby(chunks, key=attrgetter('document_id')):
+            prefix = document_id + "_"
+            string_ids.extend([prefix + str(chunk.chunk_number) for chunk in group])
+        numeric_ids = self._convert_string_ids_to_numeric(string_ids)
         
-        return numeric_id
+        payloads = [
+            {
+                "text": chunk.text,
+                "metadata": {**chunk.metadata, "original_id": string_id, "document_id": chunk.document_id}
+                            if chunk.metadata
+                            else {"original_id": string_id, "document_id": chunk.document_id}
+            }
+            for chunk, string_id in zip(chunks, string_ids)
+        ]
+        return numeric_ids, payloads
+
+    @contextmanager
+    def bulk_mode(self, indexing_threshold: Optional[int] = None):
+        """Массовая загрузка: HNSW-индекс не строится во время вставки и собирается один раз в конце"""
+        # По умолчанию восстанавливается порог, действовавший в коллекции до загрузки
+        if indexing_threshold is None:
+            current = self.client.get_collection(self.collection_name).config.optimizer_config
+            indexing_threshold = current.indexing_threshold
+            if indexing_threshold is None:
+                indexing_threshold = DEFAULT_INDEXING_THRESHOLD
+        self.client.update_collection(
+            collection_name=self.collection_name,
+            optimizers_config=OptimizersConfigDiff(indexing_threshold=0)
+        )
+        logger.info(f"Indexing disabled for bulk load into {self.collection_name}")
+        try:
+            yield self
+        finally:
+            self.client.update_collection(
+                collection_name=self.collection_name,
+                optimizers_config=OptimizersConfigDiff(indexing_threshold=indexing_threshold)
+            )
+            logger.info(f"Indexing restored for {self.collection_name} (threshold {indexing_threshold})")
 
-    def upsert_chunks(self, chunks: List[DocumentChunk], embeddings: List[List[float]], batch_size: int = 100):
+    def upload_chunks(self, chunks: List[DocumentChunk], embeddings: np.ndarray, batch_size: int = 64,
+                      parallel: int = 1):
+        """Массовая загрузка чанков через upload_collection: пакетирование и повторы выполняет клиент"""
+        # parallel > 1 поднимает новый пул процессов на каждый вызов; конвейер main и так
+        # совмещает загрузку с расчетом эмбеддингов, поэтому по умолчанию загрузка в одном процессе
+        if not chunks:
+            logger.warning("No chunks to upload")
+            return
+        
+        numeric_ids, payloads = self._build_ids_and_payloads(chunks)
+        logger.info(f"Uploading {len(chunks)} chunks in batches of {batch_size} with {parallel} workers")
+        self.client.upload_collection(
+            collection_name=self.collection_name,
+            vectors=embeddings,
+            payload=payloads,
+            ids=numeric_ids,
+            batch_size=batch_size,
+            parallel=parallel
+        )
+        logger.info(f"Uploaded {len(chunks)} chunks")
+
+    def upsert_chunks(self, chunks: List[DocumentChunk], embeddings: np.ndarray, batch_size: int = 64,
+                      concurrency: int = 8):
         """Вставка или обновление чанков в базе с разбивкой на пакеты"""
+        return asyncio.run(self.upsert_chunks_async(chunks, embeddings, batch_size, concurrency))
+
+    async def upsert_chunks_async(self, chunks: List[DocumentChunk], embeddings: np.ndarray,
+                                  batch_size: int = 64, concurrency: int = 8,
+                                  aclient: Optional[AsyncQdrantClient] = None) -> int:
+        """Асинхронная вставка чанков: до concurrency пакетов отправляются одновременно.
+        Переданный aclient переиспользуется и не закрывается; без него клиент создается на один вызов"""
         total_chunks = len(chunks)
         
         if total_chunks == 0:
             logger.warning("No chunks to upsert")
-            return
+            return 0
         
         logger.info(f"Upserting {total_chunks} chunks in batches of {batch_size}")
         
-        points = []
-        for chunk, embedding in zip(chunks, embeddings):
-            string_id = f"{chunk.document_id}_{chunk.chunk_number}"
-            numeric_id = self._convert_string_id_to_numeric(string_id)
-            
-            metadata = chunk.metadata.copy() if chunk.metadata else {}
-            metadata["original_id"] = string_id
-            
-            points.append(PointStruct(
-                id=numeric_id,
-                vector=embedding,
-                payload={
-                    "text": chunk.text,
-                    "metadata": metadata
-                }
-            ))
+        numeric_ids, payloads = self._build_ids_and_payloads(chunks)
+        
+        # Массив эмбеддингов остается float32 до этого места; PointStruct принимает
+        # только список чисел, поэтому строка конвертируется одним вызовом tolist()
+        points = [
+            PointStruct(id=numeric_id, vector=embedding.tolist(), payload=payload)
+            for numeric_id, embedding, payload in zip(numeric_ids, embeddings, payloads)
+        ]
         
         batches = [points[i:i + batch_size] for i in range(0, len(points), batch_size)]
         logger.info(f"Split into {len(batches)} batches")
         
-        total_inserted = 0
-        for i, batch in enumerate(batches):
+        semaphore = asyncio.Semaphore(concurrency)
+        own_client = aclient is None
+        if own_client:
+            aclient = self.create_async_client()
+        
+        async def upsert_limited(i: int, batch: List[PointStruct]) -> int:
+            async with semaphore:
+                return await self._upsert_batch_async(aclient, i, len(batches), batch, batch_size, wait=False)
+        
+        # Все пакеты, кроме последнего, отправляются без ожидания применения на сервере;
+        # последний отправляется с wait=True уже после них и служит барьером: Qdrant применяет
+        # обновления коллекции по порядку, поэтому к его завершению применены и все предыдущие
+        last = len(batches) - 1
+        try:
+            inserted = await asyncio.gather(*(upsert_limited(i, batch) for i, batch in enumerate(batches[:last])))
+            inserted.append(await self._upsert_batch_async(aclient, last, len(batches), batches[last], batch_size,
+                                                           wait=True))
+        finally:
+            if own_client:
+                await aclient.close()
+        
+        total_inserted = sum(inserted)
+        logger.info(f"Inserted {total_inserted}/{total_chunks} chunks total")
+        return total_inserted
+
+    async def _upsert_with_retries(self, aclient: AsyncQdrantClient, points: List[PointStruct], wait: bool = True):
+        """Upsert с экспоненциальной задержкой между попытками; после последней неудачи исключение пробрасывается"""
+        for attempt in range(UPSERT_ATTEMPTS):
             try:
-                logger.info(f"Upserting batch {i+1}/{len(batches)} with {len(batch)} chunks")
-                operation_info = self.client.upsert(
+                return await aclient.upsert(
                     collection_name=self.collection_name,
-                    wait=True,
-                    points=batch
+                    wait=wait,
+                    points=points
                 )
-                total_inserted += len(batch)
-                logger.info(f"Batch {i+1} inserted successfully. Status: {operation_info.status}")
-                
-                if i < len(batches) - 1:
-                    time.sleep(0.2)
-                    
             except Exception as e:
-                logger.error(f"Error upserting batch {i+1}: {str(e)}")
-                if len(batch) > 10:
-                    logger.info(f"Retrying batch {i+1} with smaller chunks")
-                    smaller_batches = [batch[j:j + batch_size//2] for j in range(0, len(batch), batch_size//2)]
-                    for k, small_batch in enumerate(smaller_batches):
-                        try:
-                            operation_info = self.client.upsert(
-                                collection_name=self.collection_name,
-                                wait=True,
-                                points=small_batch
-                            )
-                            total_inserted += len(small_batch)
-                            logger.info(f"Small batch {k+1}/{len(smaller_batches)} inserted successfully")
-                            time.sleep(0.3)
-                        except Exception as e2:
-                            logger.error(f"Failed to insert small batch {k+1}: {str(e2)}")
-                else:
-                    logger.error(f"Failed to insert chunks in batch {i+1}, skipping")
+                if attempt == UPSERT_ATTEMPTS - 1:
+                    raise
+                delay = min(UPSERT_BACKOFF_BASE * 2 ** attempt, UPSERT_BACKOFF_MAX)
+                logger.warning(f"Upsert of {len(points)} points failed ({e}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def _upsert_batch_async(self, aclient: AsyncQdrantClient, i: int, n_batches: int,
+                                  batch: List[PointStruct], batch_size: int, wait: bool = True) -> int:
+        """Отправка одного пакета; если повторы не помогли, пакет отправляется половинами"""
+        try:
+            logger.info(f"Upserting batch {i+1}/{n_batches} with {len(batch)} chunks")
+            operation_info = await self._upsert_with_retries(aclient, batch, wait)
+            logger.info(f"Batch {i+1} inserted successfully. Status: {operation_info.status}")
+            return len(batch)
+        except Exception as e:
+            logger.error(f"Error upserting batch {i+1}: {str(e)}")
+            if len(batch) <= 10:
+                logger.error(f"Failed to insert chunks in batch {i+1}, skipping")
+                return 0
         
-        logger.info(f"Inserted {total_inserted}/{total_chunks} chunks total")
+        logger.info(f"Retrying batch {i+1} with smaller chunks")
+        half = max(1, batch_size // 2)
+        smaller_batches = [batch[j:j + half] for j in range(0, len(batch), half)]
+        inserted = 0
+        for k, small_batch in enumerate(smaller_batches):
+            try:
+                await self._upsert_with_retries(aclient, small_batch, wait)
+                inserted += len(small_batch)
+                logger.info(f"Small batch {k+1}/{len(smaller_batches)} inserted successfully")
+            except Exception as e2:
+                logger.error(f"Failed to insert small batch {k+1}: {str(e2)}")
+        return inserted
+
+    def get_collection_cached(self, ttl: float = COLLECTION_INFO_TTL):
+        """Сведения о коллекции, переиспользуемые ttl секунд; ttl=math.inf — до конца работы процесса"""
+        # Блокировка: при параллельных вызовах из потоков коллекция запрашивается один раз
+        with self._collection_info_lock:
+            now = time.monotonic()
+            if self._collection_info is None or now - self._collection_info_at > ttl:
+                self._collection_info = self.client.get_collection(self.collection_name)
+                self._collection_info_at = now
+            return self._collection_info
 
-    def search_similar(self, query_vector: List[float], limit: int = 5, threshold: float = 0.7):
+    def _point_ids_cache_path(self) -> Path:
+        return point_ids_cache_path(self._client_kwargs['host'], self._client_kwargs['port'], self.collection_name)
+
+    def list_point_ids(self) -> list:
+        """Список ID всех точек коллекции (без payload и векторов); кэшируется в памяти и между запусками"""
+        if self._point_ids is None:
+            points_count = self.get_collection_cached().points_count
+            cache_path = self._point_ids_cache_path()
+            point_ids = load_point_ids_cache(cache_path, points_count)
+            if point_ids is None:
+                point_ids = scroll_point_ids(self.client, self.collection_name)
+                save_point_ids_cache(cache_path, points_count, point_ids)
+            self._point_ids = point_ids
+        return self._point_ids
+
+    def invalidate_point_ids(self):
+        """Сбрасывает список ID в памяти и на диске (например, если выбранных ID уже нет в коллекции)"""
+        self._point_ids = None
+        invalidate_point_ids_cache(self._point_ids_cache_path())
+
+    @staticmethod
+    def _search_params(hnsw_ef: Optional[int], rescore: Optional[bool]) -> Optional[SearchParams]:
+        """Параметры HNSW и квантования для запроса; None — значения коллекции по умолчанию"""
+        if not hnsw_ef and rescore is None:
+            return None
+        # С rescore кандидаты, найденные по int8-векторам (с запасом RESCORE_OVERSAMPLING),
+        # переранжируются по исходным векторам: полнота сохраняется и при небольшом hnsw_ef.
+        # Без rescore оценки берутся из квантованных векторов: быстрее, но порядок и score приблизительные
+        quantization = None
+        if rescore is not None:
+            quantization = QuantizationSearchParams(
+                rescore=rescore,
+                oversampling=RESCORE_OVERSAMPLING if rescore else None
+            )
+        return SearchParams(hnsw_ef=hnsw_ef or None, exact=False, quantization=quantization)
+
+    def search_similar(self, query_vector: Union[np.ndarray, List[float]], limit: int = 5, threshold: float = 0.7,
+                       hnsw_ef: Optional[int] = None, rescore: Optional[bool] = None):
         """Поиск похожих документов на основе векторного запроса"""
-        search_results = self.client.search(
+        # Порог применяется на сервере: точки ниже threshold не передаются клиенту
+        response = self.client.query_points(
             collection_name=self.collection_name,
-            query_vector=query_vector,
+            query=query_vector,
             limit=limit,
-            score_threshold=threshold
+            score_threshold=threshold,
+            search_params=self._search_params(hnsw_ef, rescore),
+            with_payload=True
+        )
+        
+        results = self._format_hits(response.points)
+        logger.info(f"Found {len(results)} similar documents with threshold {threshold}")
+        return results
+
+    def search_similar_batch(self, query_vectors: np.ndarray, limit: int = 5, threshold: float = 0.7) -> List[List[dict]]:
+        """Поиск по нескольким векторам за один запрос к Qdrant; результаты в порядке запросов"""
+        requests = [
+            QueryRequest(
+                query=vector.tolist(),
+                limit=limit,
+                score_threshold=threshold,
+                with_payload=True
+            )
+            for vector in query_vectors
+        ]
+        batch_results = self.client.query_batch_points(
+            collection_name=self.collection_name,
+            requests=requests
         )
         
+        results = [self._format_hits(response.points) for response in batch_results]
+        logger.info(f"Batch search for {len(requests)} queries found {sum(map(len, results))} documents "
+                    f"with threshold {threshold}")
+        return results
+
+    @staticmethod
+    def _format_hits(search_results) -> List[dict]:
+        """Приведение найденных точек к словарям с текстом, метаданными, оценкой и исходным ID"""
         results = []
         for result in search_results:
             metadata = result.payload.get("metadata", {})
@@ -126,44 +436,25 @@ class QdrantManager:
                 "score": result.score,
                 "id": original_id
             })
-            
-        logger.info(f"Found {len(results)} similar documents with threshold {threshold}")
         return results
         
     def delete_document(self, document_id: str):
         """Удаляет все чанки, принадлежащие документу с заданным ID"""
-        filter_query = {
-            "must": [
-                {
-                    "key": "metadata.original_id",
-                    "match": {
-                        "text": f"{document_id}_"
-                    }
-                }
-            ]
-        }
-        
-        scroll_results = self.client.scroll(
+        # Удаление по фильтру выполняется на сервере за один запрос, без выборки ID на клиенте;
+        # точное совпадение по индексированному metadata.document_id, без поиска подстроки
+        operation_info = self.client.delete(
             collection_name=self.collection_name,
-            scroll_filter=filter_query,
-            limit=10000,
-            with_payload=False,
-            with_vectors=False
-        )[0]
-        
-        if not scroll_results:
-            logger.warning(f"No chunks found for document {document_id}")
-            return
-        
-        ids_to_delete = [point.id for point in scroll_results]
+            points_selector=FilterSelector(
+                filter=Filter(
+                    must=[
+                        FieldCondition(
+                            key="metadata.document_id",
+                            match=MatchValue(value=document_id)
+                        )
+                    ]
+                )
+            ),
+            wait=True
+        )
         
-        if ids_to_delete:
-            operation_info = self.client.delete(
-                collection_name=self.collection_name,
-                points_selector=ids_to_delete,
-                wait=True
-            )
-            
-            logger.info(f"Deleted {len(ids_to_delete)} chunks for document {document_id}. Status: {operation_info.status}")
-        else:
-            logger.warning(f"No chunks to delete for document {document_id}") 
\ No newline at end of file
+        logger.info(f"Deleted chunks for document {document_id}. Status: {operation_info.status}")
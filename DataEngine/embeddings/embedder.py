@@ -1,20 +1,58 @@
 from typing import List
 from sentence_transformers import SentenceTransformer
+import numpy as np
 import torch
+from utils.logger import logger
+from utils.system import available_cpu_count
 
 class Embedder:
     def __init__(self, config):
         self.device = config.device if hasattr(config, 'device') else 'cpu'
-        self.model = SentenceTransformer(
+        self.backend = getattr(config, 'backend', 'torch')
+        self.model = self._load_model(config)
+        self.batch_size = config.batch_size
+        self._configure_runtime()
+
+    def _load_model(self, config) -> SentenceTransformer:
+        """Загрузка модели с выбранным бэкендом; при недоступности ONNX Runtime - откат на torch"""
+        if self.backend == 'onnx':
+            model_kwargs = {'file_name': config.model_file} if getattr(config, 'model_file', None) else None
+            try:
+                return SentenceTransformer(
+                    config.model_name,
+                    device=self.device,
+                    backend='onnx',
+                    model_kwargs=model_kwargs
+                )
+            except Exception as e:
+                logger.warning(f"Could not load ONNX backend for {config.model_name}, falling back to torch: {e}")
+                self.backend = 'torch'
+        
+        return SentenceTransformer(
             config.model_name,
             device=self.device
         )
-        self.batch_size = config.batch_size
 
-    def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+    def _configure_runtime(self):
+        """Настройка torch под устройство: число потоков на CPU, fp16/TF32 на CUDA"""
+        if self.backend != 'torch':
+            return
+        if self.device == 'cpu':
+            # Больше 8 потоков на матричных операциях энкодера почти не дает прироста
+            torch.set_num_threads(min(8, available_cpu_count()))
+        elif self.device.startswith('cuda') and torch.cuda.is_available():
+            torch.backends.cuda.matmul.allow_tf32 = True
+            torch.backends.cudnn.allow_tf32 = True
+            self.model.half()
+
+    def generate_embeddings(self, texts: List[str]) -> np.ndarray:
+        """Эмбеддинги текстов в виде непрерывного массива float32 формы (N, D)"""
+        # Список передается целиком: encode сам сортирует тексты по длине внутри
+        # пакетов и возвращает результат в исходном порядке
         return self.model.encode(
             texts,
             batch_size=self.batch_size,
-            convert_to_tensor=False,
+            show_progress_bar=False,
+            convert_to_numpy=True,
             normalize_embeddings=True
-        ).tolist() 
\ No newline at end of file
+        ).astype(np.float32, copy=False)
@@ -1,13 +1,30 @@
 import argparse
-from typing import List
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Iterator, List
 from pathlib import Path
 import time
-from data_processing.document_processor import DocumentProcessor
+from data_processing.document_processor import DocumentProcessor, DOC_TYPES_BY_SUFFIX, collect_files
 from data_processing.text_splitter import LegalTextSplitter
 from database.qdrant_client import QdrantManager
 from utils.config_loader import load_config
-from utils.logger import setup_logging, logger
+from utils.logger import setup_logging, setup_worker_logging, get_log_queue, logger
 from embeddings.embedder import Embedder
+from utils.system import available_cpu_count
+
+# Чанки нескольких файлов копятся до этого размера и только затем
+# отправляются в эмбеддер и Qdrant одним пакетом
+EMBED_FLUSH_SIZE = 512
+
+# Число готовых пакетов эмбеддингов, ожидающих загрузки в Qdrant
+PIPELINE_DEPTH = 2
+
+# Сколько файлов на один рабочий процесс одновременно находится в пуле (в очереди или в работе)
+IN_FLIGHT_PER_WORKER = 2
+
+# Обработчик и разделитель рабочего процесса пула (создаются в _init_worker)
+_worker_processor = None
+_worker_splitter = None
 
 def parse_args():
     parser = argparse.ArgumentParser(description='Process legal documents')
@@ -64,12 +81,11 @@ def process_single_document(file_path: str, doc_type: str, processor, splitter,
         logger.info(f"Document processed successfully: {file_path}")
         chunks = splitter.split_document(document)
         logger.info(f"Document split into {len(chunks)} chunks.")
-        embeddings = embedder.generate_embeddings([
-            chunk.text for chunk in chunks
-        ])
-        logger.info("Embeddings generated for chunks.")
-        qdrant.upsert_chunks(chunks, embeddings)
-        logger.info(f"Chunks upserted to Qdrant for file: {file_path}")
+        # Пакеты документа проходят через конвейер: эмбеддинги следующего пакета
+        # считаются одновременно с загрузкой предыдущего
+        chunk_batches = (chunks[i:i + EMBED_FLUSH_SIZE] for i in range(0, len(chunks), EMBED_FLUSH_SIZE))
+        asyncio.run(_embed_and_upsert_pipeline(chunk_batches, qdrant, embedder))
+        logger.info(f"Chunks embedded and upserted to Qdrant for file: {file_path}")
         
         processing_time = time.time() - start_time
         logger.info(f"Document processing completed in {processing_time:.2f} seconds")
@@ -78,8 +94,54 @@ def process_single_document(file_path: str, doc_type: str, processor, splitter,
         logger.warning(f"Failed to process document: {file_path}")
         return False
 
-def process_batch(input_dir: str, extensions: List[str], processor, splitter, qdrant, embedder, stats: bool = False):
-    """Пакетная обработка документов"""
+def _init_worker(clean_patterns: List[str], chunk_size: int, chunk_overlap: int, log_queue=None):
+    """Инициализация обработчика документов и разделителя в рабочем процессе пула"""
+    global _worker_processor, _worker_splitter
+    setup_worker_logging(log_queue)
+    _worker_processor = DocumentProcessor(clean_patterns)
+    _worker_splitter = LegalTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+def _parse_and_split(path_str: str, doc_type: str) -> tuple:
+    """Разбор и разбиение одного файла в рабочем процессе, возвращает (doc_type, chunks)"""
+    document = _worker_processor.process_document(Path(path_str), doc_type)
+    if document is None:
+        return None, []
+    return document.doc_type, _worker_splitter.split_document(document)
+
+async def _embed_and_upsert_pipeline(chunk_batches: Iterator[list], qdrant, embedder, bulk: bool = False):
+    """Конвейер: эмбеддинги следующего пакета считаются, пока предыдущий загружается в Qdrant"""
+    queue = asyncio.Queue(maxsize=PIPELINE_DEPTH)
+    
+    async def produce():
+        # Получение пакета (ожидание пула) и эмбеддинги блокирующие, поэтому идут в отдельном потоке.
+        # При ошибке в любой из стадий gather пробрасывает ее, а asyncio.run отменяет вторую стадию
+        while (chunks := await asyncio.to_thread(next, chunk_batches, None)) is not None:
+            embeddings = await asyncio.to_thread(
+                embedder.generate_embeddings, [chunk.text for chunk in chunks]
+            )
+            await queue.put((chunks, embeddings))
+        await queue.put(None)
+    
+    # Один асинхронный клиент (одно соединение) на весь прогон, а не на каждый сброс пакета
+    aclient = None if bulk else qdrant.create_async_client()
+    
+    async def consume():
+        while (item := await queue.get()) is not None:
+            chunks, embeddings = item
+            if bulk:
+                await asyncio.to_thread(qdrant.upload_chunks, chunks, embeddings)
+            else:
+                await qdrant.upsert_chunks_async(chunks, embeddings, aclient=aclient)
+    
+    try:
+        await asyncio.gather(produce(), consume())
+    finally:
+        if aclient is not None:
+            await aclient.close()
+
+def process_batch(input_dir: str, extensions: List[str], clean_patterns: List[str], splitter, qdrant, embedder,
+                  stats: bool = False, bulk: bool = False):
+    """Пакетная обработка документов; bulk - массовая загрузка без инкрементальной индексации"""
     input_dir = Path(input_dir)
     if not input_dir.exists() or not input_dir.is_dir():
         logger.error(f"Directory not found: {input_dir}")
@@ -88,27 +150,75 @@ def process_batch(input_dir: str, extensions: List[str], processor, splitter, qd
     start_time = time.time()
     logger.info(f"Batch processing documents from {input_dir}")
     
-    results = processor.batch_process_documents(input_dir, extensions)
-    
-    total_chunks = 0
-    for file_path in input_dir.glob("*"):
-        if file_path.suffix.lower() in extensions:
-            doc_type = 'legal-txt'
-            if file_path.suffix.lower() == '.pdf':
-                doc_type = 'pdf'
-            elif file_path.suffix.lower() in ['.html', '.xml']:
-                doc_type = 'html'
-                
-            document = processor.process_document(file_path, doc_type=doc_type)
-            if document:
-                chunks = splitter.split_document(document)
-                total_chunks += len(chunks)
-                
-                if chunks:
-                    embeddings = embedder.generate_embeddings([
-                        chunk.text for chunk in chunks
-                    ])
-                    qdrant.upsert_chunks(chunks, embeddings)
+    files_to_process = collect_files(input_dir, extensions)
+    
+    # Разбор и разбиение файлов идут параллельно в пуле процессов, а эмбеддинги
+    # и загрузка в Qdrant - в конвейере основного процесса пакетами по EMBED_FLUSH_SIZE чанков.
+    # Статистика собирается из тех же результатов, повторный разбор не нужен
+    results = {
+        'processed_files': 0,
+        'failed_files': 0,
+        'document_types': {},
+        'total_chunks': 0
+    }
+    
+    def iter_chunk_batches() -> Iterator[list]:
+        buffer = []
+        workers = available_cpu_count()
+        remaining_files = iter(files_to_process)
+        pending = {}
+        executor = ProcessPoolExecutor(max_workers=workers,
+                                       initializer=_init_worker,
+                                       initargs=(clean_patterns, splitter.chunk_size, splitter.chunk_overlap,
+                                                 get_log_queue()))
+        
+        def submit_next():
+            file_path = next(remaining_files, None)
+            if file_path is not None:
+                doc_type = DOC_TYPES_BY_SUFFIX.get(Path(file_path).suffix.lower(), 'legal-txt')
+                pending[executor.submit(_parse_and_split, file_path, doc_type)] = file_path
+        
+        try:
+            # В работе одновременно не больше IN_FLIGHT_PER_WORKER файлов на процесс: если эмбеддинги
+            # или загрузка отстают от разбора, готовые результаты не копятся в памяти
+            for _ in range(workers * IN_FLIGHT_PER_WORKER):
+                submit_next()
+            
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    file_path = pending.pop(future)
+                    submit_next()
+                    try:
+                        doc_type, chunks = future.result()
+                    except Exception as e:
+                        logger.error(f"Error processing file {file_path}: {str(e)}", exc_info=True)
+                        doc_type, chunks = None, []
+                    
+                    if doc_type is None:
+                        results['failed_files'] += 1
+                        continue
+                    
+                    results['processed_files'] += 1
+                    results['document_types'][doc_type] = results['document_types'].get(doc_type, 0) + 1
+                    results['total_chunks'] += len(chunks)
+                    buffer.extend(chunks)
+                    if len(buffer) >= EMBED_FLUSH_SIZE:
+                        yield buffer
+                        buffer = []
+        finally:
+            # При ошибке конвейера файлы, еще не взятые в работу, отменяются, а не разбираются впустую
+            executor.shutdown(cancel_futures=True)
+        
+        if buffer:
+            yield buffer
+    
+    chunk_batches = iter_chunk_batches()
+    try:
+        asyncio.run(_embed_and_upsert_pipeline(chunk_batches, qdrant, embedder, bulk))
+    finally:
+        chunk_batches.close()
+    total_chunks = results['total_chunks']
     
     processing_time = time.time() - start_time
     logger.info(f"Batch processing completed in {processing_time:.2f} seconds")
@@ -124,7 +234,7 @@ def process_batch(input_dir: str, extensions: List[str], processor, splitter, qd
         print(f"Типы документов: {results['document_types']}")
         print(f"Общее время обработки: {processing_time:.2f} секунд")
 
-def reindex_collection(input_dir: str, confirm: bool, processor, splitter, qdrant, embedder):
+def reindex_collection(input_dir: str, confirm: bool, clean_patterns: List[str], splitter, qdrant, embedder):
     """Очистка и переиндексация коллекции"""
     input_dir = Path(input_dir)
     if not input_dir.exists() or not input_dir.is_dir():
@@ -141,7 +251,9 @@ def reindex_collection(input_dir: str, confirm: bool, processor, splitter, qdran
     qdrant._initialize_collection()
     
     logger.info("Starting reindexing process")
-    process_batch(input_dir, ['.txt', '.pdf', '.html', '.xml'], processor, splitter, qdrant, embedder)
+    with qdrant.bulk_mode():
+        process_batch(input_dir, ['.txt', '.pdf', '.html', '.xml'], clean_patterns, splitter, qdrant, embedder,
+                      bulk=True)
     logger.info("Reindexing completed")
 
 def main():
@@ -181,7 +293,7 @@ def main():
             process_batch(
                 args.input_dir, 
                 args.extensions, 
-                processor, 
+                config.processing.text_clean_patterns, 
                 splitter, 
                 qdrant, 
                 embedder,
@@ -191,7 +303,7 @@ def main():
             reindex_collection(
                 args.input_dir, 
                 args.confirm, 
-                processor, 
+                config.processing.text_clean_patterns, 
                 splitter, 
                 qdrant, 
                 embedder
@@ -1,23 +1,25 @@
+from dataclasses import dataclass, field
 from typing import Optional, List, Dict, Any
-from pydantic import BaseModel, Field
 from datetime import date
 
 
-class DocumentChunk(BaseModel):
+@dataclass(slots=True)
+class DocumentChunk:
     """Модель фрагмента документа для векторного хранилища"""
-    document_id: str = Field(description="Уникальный идентификатор исходного документа")
-    chunk_number: int = Field(description="Последовательный номер фрагмента в документе")
-    text: str = Field(description="Текстовое содержимое фрагмента")
-    metadata: Dict[str, Any] = Field(default_factory=dict, description="Метаданные фрагмента (тип, статья, и т.д.)")
+    document_id: str  # Уникальный идентификатор исходного документа
+    chunk_number: int  # Последовательный номер фрагмента в документе
+    text: str  # Текстовое содержимое фрагмента
+    metadata: Dict[str, Any] = field(default_factory=dict)  # Метаданные фрагмента (тип, статья, и т.д.)
     
     def get_id(self) -> str:
         """Получение уникального идентификатора чанка"""
         return f"{self.document_id}_{self.chunk_number}" 
 
-class LegalDocument(BaseModel):
+@dataclass(slots=True)
+class LegalDocument:
     """Модель юридического документа"""
     file_path: str
-    content: List[DocumentChunk] = Field(default_factory=list)
+    content: List[DocumentChunk] = field(default_factory=list)
     doc_type: str = "unknown"
     adoption_date: Optional[date] = None
-    keywords: List[str] = Field(default_factory=list)
\ No newline at end of file
+    keywords: List[str] = field(default_factory=list)
@@ -1,4 +1,6 @@
+from functools import lru_cache
 from typing import List, Dict, Any, Optional
+import numpy as np
 from database.qdrant_client import QdrantManager
 from embeddings.embedder import Embedder
 from utils.logger import logger
@@ -19,9 +21,18 @@ class LegalDocumentSearch:
         """
         self.embedder = embedder
         self.qdrant = qdrant_manager
+        # Кэш эмбеддингов запросов: повторный запрос не требует прохода модели
+        self._embed_query = lru_cache(maxsize=1024)(self._compute_query_embedding)
         logger.info("LegalDocumentSearch initialized")
         
-    def search(self, query: str, limit: int = 5, threshold: float = 0.7) -> List[Dict[str, Any]]:
+    def _compute_query_embedding(self, query: str) -> np.ndarray:
+        """Эмбеддинг одного запроса; массив только для чтения, так как разделяется через кэш"""
+        embedding = self.embedder.generate_embeddings([query])[0]
+        embedding.setflags(write=False)
+        return embedding
+        
+    def search(self, query: str, limit: int = 5, threshold: float = 0.7,
+               hnsw_ef: Optional[int] = None, rescore: Optional[bool] = None) -> List[Dict[str, Any]]:
         """
         Поиск релевантных документов по естественному запросу
         
@@ -29,25 +40,53 @@ class LegalDocumentSearch:
             query: Текстовый запрос на естественном языке
             limit: Максимальное число результатов
             threshold: Минимальный порог релевантности
+            hnsw_ef: Размер списка кандидатов HNSW (None — значение коллекции)
+            rescore: Переранжировать кандидатов по исходным векторам (None — значение коллекции)
             
         Returns:
             Список найденных документов с метаданными и оценкой релевантности
         """
         logger.info(f"Searching for: '{query}'")
         
-        # Генерация эмбеддинга для запроса
-        query_embedding = self.embedder.generate_embeddings([query])[0]
+        # Генерация эмбеддинга для запроса (или получение из кэша)
+        query_embedding = self._embed_query(query)
         
         # Поиск похожих документов
         results = self.qdrant.search_similar(
             query_vector=query_embedding,
             limit=limit,
-            threshold=threshold
+            threshold=threshold,
+            hnsw_ef=hnsw_ef,
+            rescore=rescore
         )
         
         logger.info(f"Found {len(results)} relevant document chunks")
         return results
     
+    def search_batch(self, queries: List[str], limit: int = 5, threshold: float = 0.7) -> List[List[Dict[str, Any]]]:
+        """
+        Поиск по нескольким запросам: один проход модели и один запрос к Qdrant
+        
+        Args:
+            queries: Список текстовых запросов
+            limit: Максимальное число результатов на запрос
+            threshold: Минимальный порог релевантности
+            
+        Returns:
+            Списки найденных документов в порядке запросов
+        """
+        if not queries:
+            return []
+        
+        logger.info(f"Batch searching for {len(queries)} queries")
+        
+        query_embeddings = self.embedder.generate_embeddings(queries)
+        return self.qdrant.search_similar_batch(
+            query_vectors=query_embeddings,
+            limit=limit,
+            threshold=threshold
+        )
+    
     def search_by_keywords(self, keywords: List[str], limit: int = 5) -> List[Dict[str, Any]]:
         """
         Поиск документов по ключевым словам
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Модули проекта импортируются от корня DataEngine, как при запуске скриптов
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -1,17 +1,34 @@
 import argparse
-import json
+import asyncio
+import math
 import random
+import sys
+from collections import Counter
 from pathlib import Path
-from typing import List, Dict, Any
-from tabulate import tabulate
+from typing import List, Dict, Any, Iterable, Iterator, Optional
+import numpy as np
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.models import Filter, FieldCondition, MatchValue, PayloadSelectorInclude
 
-from database.qdrant_client import QdrantManager
+from database.qdrant_client import QdrantManager, COLLECTION_INFO_TTL
 from utils.config_loader import load_config
 from utils.logger import setup_logging, logger
+from utils.serialization import dumps_json
 
-def get_collection_info(qdrant: QdrantManager) -> Dict[str, Any]:
-    """Получение основной информации о коллекции"""
-    collection_info = qdrant.client.get_collection(qdrant.collection_name)
+# Максимум различных значений, возвращаемых facet-запросом по одному полю
+FACET_LIMIT = 10000
+
+# Сколько случайных точек запрашивается за один retrieve при ленивой выборке образцов
+SAMPLES_RETRIEVE_BATCH = 16
+
+# Размер пула соединений асинхронного клиента для параллельных запросов analyze
+ANALYZE_POOL_SIZE = 100
+
+def _payload_selector(*fields: str) -> PayloadSelectorInclude:
+    """Проекция payload на сервере: передаются только перечисленные ключи (например, без text)"""
+    return PayloadSelectorInclude(include=list(fields))
+
+def _collection_summary(qdrant: QdrantManager, collection_info) -> Dict[str, Any]:
     return {
         "name": qdrant.collection_name,
         "vector_size": qdrant.vector_size,
@@ -22,92 +39,249 @@ def get_collection_info(qdrant: QdrantManager) -> Dict[str, Any]:
         }
     }
 
-def get_random_samples(qdrant: QdrantManager, count: int = 5) -> List[Dict]:
-    """Получает случайные образцы данных из коллекции"""
-    collection_info = qdrant.client.get_collection(qdrant.collection_name)
-    total_points = collection_info.points_count
+def get_collection_info(qdrant: QdrantManager, ttl: float = COLLECTION_INFO_TTL) -> Dict[str, Any]:
+    """Получение основной информации о коллекции"""
+    return _collection_summary(qdrant, qdrant.get_collection_cached(ttl))
+
+async def aget_collection_info(qdrant: QdrantManager, ttl: float = COLLECTION_INFO_TTL) -> Dict[str, Any]:
+    """Асинхронный вариант get_collection_info"""
+    # Тот же кэш, что и у list_point_ids: при параллельных вызовах коллекция запрашивается один раз
+    return _collection_summary(qdrant, await asyncio.to_thread(qdrant.get_collection_cached, ttl))
+
+def _format_sample(point) -> Dict[str, Any]:
+    metadata = point.payload.get("metadata", {})
+    original_id = metadata.get("original_id", str(point.id))
     
-    if total_points == 0:
+    # Векторы запрашиваются только по флагу --full-vectors, иначе превью пустое;
+    # превью — срез numpy-массива, orjson сериализует его без промежуточных float-объектов
+    vector_preview = np.asarray(point.vector, dtype=np.float32)[:5] if point.vector else []
+    
+    return {
+        "id": point.id,
+        "original_id": original_id,
+        "text_preview": point.payload.get("text", "")[:100] + "..." if len(point.payload.get("text", "")) > 100 else point.payload.get("text", ""),
+        "metadata": metadata,
+        "vector_preview": vector_preview
+    }
+
+def _sample_point_ids(qdrant: QdrantManager, count: int) -> List:
+    """Случайные ID точек из кэшированного списка; точки затем получаются напрямую по ID"""
+    point_ids = qdrant.list_point_ids()
+    if not point_ids:
         logger.warning("Коллекция пуста")
         return []
-    
-    limit = min(count, total_points)
-    offset = random.randint(0, max(1, total_points - limit))
-    
-    scroll_results = qdrant.client.scroll(
+    return random.sample(point_ids, min(count, len(point_ids)))
+
+def _check_retrieved(qdrant: QdrantManager, points: List, requested: int):
+    """Если части выбранных ID уже нет в коллекции, кэш списка ID устарел и сбрасывается"""
+    if len(points) < requested:
+        logger.warning("Не найдено %s из %s выбранных точек, список ID будет построен заново",
+                       requested - len(points), requested)
+        qdrant.invalidate_point_ids()
+
+def get_random_samples_iter(qdrant: QdrantManager, count: int = 5, with_vectors: bool = False) -> Iterator[Dict]:
+    """Лениво выдает случайные образцы данных из коллекции, загружая точки небольшими пачками"""
+    sample_ids = _sample_point_ids(qdrant, count)
+    for start in range(0, len(sample_ids), SAMPLES_RETRIEVE_BATCH):
+        batch_ids = sample_ids[start:start + SAMPLES_RETRIEVE_BATCH]
+        points = qdrant.client.retrieve(
+            collection_name=qdrant.collection_name,
+            ids=batch_ids,
+            with_payload=_payload_selector("text", "metadata"),
+            with_vectors=with_vectors
+        )
+        _check_retrieved(qdrant, points, len(batch_ids))
+        for point in points:
+            yield _format_sample(point)
+
+def get_random_samples(qdrant: QdrantManager, count: int = 5, with_vectors: bool = False) -> List[Dict]:
+    """Получает случайные образцы данных из коллекции"""
+    return list(get_random_samples_iter(qdrant, count, with_vectors))
+
+async def aget_random_samples(qdrant: QdrantManager, aclient: AsyncQdrantClient,
+                              count: int = 5, with_vectors: bool = False) -> List[Dict]:
+    """Асинхронный вариант get_random_samples"""
+    # Список ID кэшируется синхронным клиентом (в том числе на диске), поэтому берется в отдельном потоке
+    sample_ids = await asyncio.to_thread(_sample_point_ids, qdrant, count)
+    if not sample_ids:
+        return []
+    points = await aclient.retrieve(
         collection_name=qdrant.collection_name,
-        limit=limit,
-        offset=offset,
-        with_payload=True,
-        with_vectors=True
-    )[0]
+        ids=sample_ids,
+        with_payload=_payload_selector("text", "metadata"),
+        with_vectors=with_vectors
+    )
+    _check_retrieved(qdrant, points, len(sample_ids))
+    return [_format_sample(point) for point in points]
+
+def _facet_filter(doc_type: Optional[str]) -> Optional[Filter]:
+    if doc_type is None:
+        return None
+    return Filter(must=[FieldCondition(key="metadata.type", match=MatchValue(value=doc_type))])
+
+def _facet_counts(qdrant: QdrantManager, key: str, doc_type: str = None) -> Dict[Any, int]:
+    """Точные подсчеты значений поля payload на стороне Qdrant (facet), опционально для одного типа"""
+    response = qdrant.client.facet(
+        collection_name=qdrant.collection_name,
+        key=key,
+        facet_filter=_facet_filter(doc_type),
+        limit=FACET_LIMIT,
+        exact=True
+    )
+    return _facet_hits(key, response)
+
+async def _afacet_counts(qdrant: QdrantManager, aclient: AsyncQdrantClient, key: str,
+                         doc_type: str = None) -> Dict[Any, int]:
+    response = await aclient.facet(
+        collection_name=qdrant.collection_name,
+        key=key,
+        facet_filter=_facet_filter(doc_type),
+        limit=FACET_LIMIT,
+        exact=True
+    )
+    return _facet_hits(key, response)
+
+def _facet_hits(key: str, response) -> Dict[Any, int]:
+    if len(response.hits) >= FACET_LIMIT:
+        logger.warning(f"Поле {key}: facet вернул {FACET_LIMIT} значений (лимит), число уникальных значений может быть занижено")
+    return {hit.value: hit.count for hit in response.hits}
+
+def _type_count(qdrant: QdrantManager, doc_type: str) -> int:
+    """Точное число точек заданного metadata.type"""
+    return qdrant.client.count(
+        collection_name=qdrant.collection_name,
+        count_filter=_facet_filter(doc_type),
+        exact=True
+    ).count
+
+async def _atype_count(qdrant: QdrantManager, aclient: AsyncQdrantClient, doc_type: str) -> int:
+    response = await aclient.count(
+        collection_name=qdrant.collection_name,
+        count_filter=_facet_filter(doc_type),
+        exact=True
+    )
+    return response.count
+
+def _metadata_summary(scroll_results, total_points: int, doc_types: Dict, article_count: int,
+                      article_numbers: Dict, section_count: int, sections: Dict) -> Dict[str, Any]:
+    # facet не учитывает точки без metadata.type; они, как и раньше, попадают в "unknown"
+    unknown = total_points - sum(doc_types.values())
+    if unknown > 0:
+        doc_types = {**doc_types, "unknown": unknown}
     
-    samples = []
+    metadata_fields = Counter()
     for point in scroll_results:
-        metadata = point.payload.get("metadata", {})
-        original_id = metadata.get("original_id", str(point.id))
-        
-        vector_preview = point.vector[:5] if point.vector else []
-        
-        samples.append({
-            "id": point.id,
-            "original_id": original_id,
-            "text_preview": point.payload.get("text", "")[:100] + "..." if len(point.payload.get("text", "")) > 100 else point.payload.get("text", ""),
-            "metadata": metadata,
-            "vector_preview": vector_preview
-        })
+        metadata_fields.update(point.payload.get("metadata", {}).keys())
     
-    return samples
+    return {
+        "metadata_fields": {
+            "field_stats": dict(metadata_fields),
+            "top_fields": metadata_fields.most_common(10)
+        },
+        "doc_types": doc_types,
+        "article_count": article_count,
+        "unique_articles": len(article_numbers),
+        "section_count": section_count,
+        "unique_sections": len(sections)
+    }
 
 def analyze_metadata_fields(qdrant: QdrantManager, sample_size: int = 100) -> Dict[str, Any]:
     """Анализирует и собирает статистику по полям метаданных"""
+    # Выборка нужна только для гистограммы ключей метаданных, поэтому text не запрашивается
     scroll_results = qdrant.client.scroll(
         collection_name=qdrant.collection_name,
         limit=sample_size,
-        with_payload=True,
+        with_payload=_payload_selector("metadata"),
         with_vectors=False
     )[0]
     
-    metadata_fields = {}
-    doc_types = {}
-    article_numbers = []
-    sections = []
+    # Распределения по типам, статьям и разделам считаются по всей коллекции через индексы
+    return _metadata_summary(
+        scroll_results,
+        qdrant.client.count(collection_name=qdrant.collection_name, exact=True).count,
+        _facet_counts(qdrant, "metadata.type"),
+        _type_count(qdrant, "article"),
+        _facet_counts(qdrant, "metadata.article_number", doc_type="article"),
+        _type_count(qdrant, "section"),
+        _facet_counts(qdrant, "metadata.title", doc_type="section")
+    )
+
+async def aanalyze_metadata_fields(qdrant: QdrantManager, aclient: AsyncQdrantClient,
+                                   sample_size: int = 100) -> Dict[str, Any]:
+    """Асинхронный вариант analyze_metadata_fields: выборка и facet-запросы выполняются одновременно"""
+    (scroll_results, _), total, doc_types, article_count, article_numbers, section_count, sections = await asyncio.gather(
+        aclient.scroll(
+            collection_name=qdrant.collection_name,
+            limit=sample_size,
+            with_payload=_payload_selector("metadata"),
+            with_vectors=False
+        ),
+        aclient.count(collection_name=qdrant.collection_name, exact=True),
+        _afacet_counts(qdrant, aclient, "metadata.type"),
+        _atype_count(qdrant, aclient, "article"),
+        _afacet_counts(qdrant, aclient, "metadata.article_number", doc_type="article"),
+        _atype_count(qdrant, aclient, "section"),
+        _afacet_counts(qdrant, aclient, "metadata.title", doc_type="section")
+    )
+    return _metadata_summary(scroll_results, total.count, doc_types, article_count, article_numbers,
+                             section_count, sections)
+
+def stream_analysis(result: Dict[str, Any], samples: Iterable[Dict]) -> Iterator[bytes]:
+    """Выдает JSON результата анализа по частям: ключи верхнего уровня, затем образцы по одному"""
+    yield b"{"
+    for key, value in result.items():
+        yield b"\n" + dumps_json(key) + b": " + dumps_json(value) + b","
+    yield b'\n"samples": ['
+    for i, sample in enumerate(samples):
+        yield (b"\n" if i == 0 else b",\n") + dumps_json(sample)
+    yield b"\n]\n}\n"
+
+def _cells_and_widths(rows: List[List[Any]], headers: List[str]):
+    """Ячейки в виде однострочных строк и ширина каждого столбца"""
+    cells = [[str(cell).replace("\n", " ") for cell in row] for row in rows]
+    widths = [max(len(row[i]) for row in [headers] + cells) for i in range(len(headers))]
+    return cells, widths
+
+def _render_simple(rows: List[List[Any]], headers: List[str]) -> str:
+    """Таблица без рамки, как tabulate "simple": заголовок, строка из дефисов, столбцы через два пробела"""
+    cells, widths = _cells_and_widths(rows, headers)
+    
+    def line(row):
+        return "  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip()
     
-    for point in scroll_results:
-        metadata = point.payload.get("metadata", {})
-        
-        for key in metadata.keys():
-            if key not in metadata_fields:
-                metadata_fields[key] = 0
-            metadata_fields[key] += 1
-        
-        doc_type = metadata.get("type", "unknown")
-        if doc_type not in doc_types:
-            doc_types[doc_type] = 0
-        doc_types[doc_type] += 1
-        
-        if doc_type == "article" and "article_number" in metadata:
-            article_numbers.append(metadata["article_number"])
-        
-        if doc_type == "section" and "title" in metadata:
-            sections.append(metadata["title"])
+    lines = [line(headers), "  ".join("-" * width for width in widths)]
+    lines.extend(line(row) for row in cells)
+    return "\n".join(lines)
+
+def _render_grid(rows: List[List[Any]], headers: List[str]) -> str:
+    """Таблица с рамкой: ширина столбцов вычисляется один раз, строки собираются через join"""
+    cells, widths = _cells_and_widths(rows, headers)
+    border = "+" + "+".join("-" * (width + 2) for width in widths) + "+"
     
-    return {
-        "metadata_fields": {
-            "field_stats": metadata_fields,
-            "top_fields": sorted(metadata_fields.items(), key=lambda x: x[1], reverse=True)[:10]
-        },
-        "doc_types": doc_types,
-        "article_count": len(article_numbers),
-        "unique_articles": len(set(article_numbers)),
-        "section_count": len(sections),
-        "unique_sections": len(set(sections))
-    }
+    def line(row):
+        return "| " + " | ".join(cell.ljust(width) for cell, width in zip(row, widths)) + " |"
+    
+    lines = [border, line(headers), border.replace("-", "=")]
+    for row in cells:
+        lines.append(line(row))
+        lines.append(border)
+    if not cells:
+        lines[-1] = border
+    return "\n".join(lines)
 
-def format_output(data: Dict, format_type: str):
+def _render_table(rows: List[List[Any]], headers: List[str], pretty: bool, tablefmt: str = "grid") -> str:
+    # tabulate нужен только для --pretty (многострочные ячейки, выравнивание чисел)
+    if pretty:
+        from tabulate import tabulate
+        return tabulate(rows, headers=headers, tablefmt=tablefmt)
+    if tablefmt == "simple":
+        return _render_simple(rows, headers)
+    return _render_grid(rows, headers)
+
+def format_output(data: Dict, format_type: str, pretty: bool = False):
     """Форматирует вывод в различных форматах"""
     if format_type == "json":
-        return json.dumps(data, ensure_ascii=False, indent=2)
+        return dumps_json(data).decode('utf-8')
     elif format_type == "table":
         tables = []
         
@@ -117,20 +291,20 @@ def format_output(data: Dict, format_type: str):
             for key, value in data.items():
                 if key != "vectors_config":
                     info_table.append([key, value])
-            tables.append(tabulate(info_table, headers=["Параметр", "Значение"], tablefmt="grid"))
+            tables.append(_render_table(info_table, ["Параметр", "Значение"], pretty))
         
         if "metadata_fields" in data:
             tables.append("\n=== Статистика полей метаданных ===")
             metadata_table = []
             for field, count in data["metadata_fields"]["top_fields"]:
                 metadata_table.append([field, count])
-            tables.append(tabulate(metadata_table, headers=["Поле", "Количество"], tablefmt="grid"))
+            tables.append(_render_table(metadata_table, ["Поле", "Количество"], pretty))
             
             tables.append("\n=== Статистика типов документов ===")
             doc_types_table = []
             for doc_type, count in data["doc_types"].items():
                 doc_types_table.append([doc_type, count])
-            tables.append(tabulate(doc_types_table, headers=["Тип", "Количество"], tablefmt="grid"))
+            tables.append(_render_table(doc_types_table, ["Тип", "Количество"], pretty))
         
         if "samples" in data:
             tables.append("\n=== Образцы документов ===")
@@ -147,7 +321,7 @@ def format_output(data: Dict, format_type: str):
                 if "title" in metadata:
                     samples_table.append(["Заголовок", metadata["title"]])
                 
-                tables.append(tabulate(samples_table, headers=["Поле", "Значение"], tablefmt="simple"))
+                tables.append(_render_table(samples_table, ["Поле", "Значение"], pretty, tablefmt="simple"))
         
         return "\n".join(tables)
     else:
@@ -161,85 +335,129 @@ def parse_args():
     info_parser = subparsers.add_parser('info', help='Информация о коллекции')
     info_parser.add_argument('--format', choices=['json', 'table'], default='table',
                             help='Формат вывода')
+    info_parser.add_argument('--pretty', action='store_true',
+                             help='Отрисовывать таблицы через tabulate')
     
     samples_parser = subparsers.add_parser('samples', help='Получить образцы данных')
     samples_parser.add_argument('--count', type=int, default=5,
                               help='Количество образцов')
     samples_parser.add_argument('--format', choices=['json', 'table'], default='table',
                               help='Формат вывода')
+    samples_parser.add_argument('--pretty', action='store_true',
+                                help='Отрисовывать таблицы через tabulate')
+    samples_parser.add_argument('--full-vectors', action='store_true',
+                              help='Загружать векторы точек для превью')
     
     metadata_parser = subparsers.add_parser('metadata', help='Анализ метаданных')
     metadata_parser.add_argument('--sample-size', type=int, default=100,
                                help='Размер выборки для анализа')
     metadata_parser.add_argument('--format', choices=['json', 'table'], default='table',
                                help='Формат вывода')
+    metadata_parser.add_argument('--pretty', action='store_true',
+                                 help='Отрисовывать таблицы через tabulate')
     
     analyze_parser = subparsers.add_parser('analyze', help='Полный анализ данных')
     analyze_parser.add_argument('--format', choices=['json', 'table'], default='table',
                               help='Формат вывода')
+    analyze_parser.add_argument('--pretty', action='store_true',
+                                help='Отрисовывать таблицы через tabulate')
     analyze_parser.add_argument('--output', type=str, help='Путь для сохранения результатов')
+    analyze_parser.add_argument('--full-vectors', action='store_true',
+                              help='Загружать векторы точек для превью')
     
     return parser.parse_args()
 
-def main():
-    args = parse_args()
-    logger = setup_logging()
-    logger.info("Запуск инспектирования Qdrant")
+class CliApp:
+    """Общее состояние CLI: логирование, конфигурация и клиент Qdrant создаются один раз на процесс"""
     
-    try:
-        config = load_config()
-        logger.info("Конфигурация загружена успешно.")
-
-        qdrant = QdrantManager(config.qdrant)
-        logger.info("Qdrant клиент инициализирован.")
+    def __init__(self):
+        self.logger = setup_logging()
+        self.logger.info("Запуск инспектирования Qdrant")
         
-        result = {}
+        self.config = load_config()
+        self.logger.info("Конфигурация загружена успешно.")
         
-        if args.command == 'info':
-            logger.info("Получение информации о коллекции")
-            result = get_collection_info(qdrant)
-            print(format_output(result, args.format))
-            
-        elif args.command == 'samples':
-            logger.info(f"Получение {args.count} образцов данных")
-            samples = get_random_samples(qdrant, args.count)
-            result = {"samples": samples}
-            print(format_output(result, args.format))
-            
-        elif args.command == 'metadata':
-            logger.info(f"Анализ метаданных (выборка: {args.sample_size})")
-            result = analyze_metadata_fields(qdrant, args.sample_size)
-            print(format_output(result, args.format))
-            
-        elif args.command == 'analyze':
-            logger.info("Запуск полного анализа данных")
-            result = get_collection_info(qdrant)
-            metadata_analysis = analyze_metadata_fields(qdrant, 100)
-            samples = get_random_samples(qdrant, 3)
-            
-            result.update(metadata_analysis)
-            result["samples"] = samples
-            
-            formatted_output = format_output(result, args.format)
+        self.qdrant = QdrantManager(self.config.qdrant)
+        self.logger.info("Qdrant клиент инициализирован.")
+    
+    def cmd_info(self, args):
+        self.logger.info("Получение информации о коллекции")
+        result = get_collection_info(self.qdrant)
+        print(format_output(result, args.format, args.pretty))
+    
+    def cmd_samples(self, args):
+        self.logger.info("Получение %s образцов данных", args.count)
+        samples = get_random_samples(self.qdrant, args.count, args.full_vectors)
+        print(format_output({"samples": samples}, args.format, args.pretty))
+    
+    def cmd_metadata(self, args):
+        self.logger.info("Анализ метаданных (выборка: %s)", args.sample_size)
+        result = analyze_metadata_fields(self.qdrant, args.sample_size)
+        print(format_output(result, args.format, args.pretty))
+    
+    async def _analyze_async(self, with_vectors: bool):
+        """Информация о коллекции, метаданные и образцы запрашиваются параллельно"""
+        aclient = self.qdrant.create_async_client(pool_size=ANALYZE_POOL_SIZE)
+        try:
+            return await asyncio.gather(
+                # analyze только читает данные, поэтому сведения о коллекции не перезапрашиваются
+                aget_collection_info(self.qdrant, math.inf),
+                aanalyze_metadata_fields(self.qdrant, aclient, 100),
+                aget_random_samples(self.qdrant, aclient, 3, with_vectors)
+            )
+        finally:
+            await aclient.close()
+    
+    def cmd_analyze(self, args):
+        self.logger.info("Запуск полного анализа данных")
+        result, metadata_analysis, samples = asyncio.run(self._analyze_async(args.full_vectors))
+        result.update(metadata_analysis)
+        
+        if args.format == 'json':
+            # JSON пишется потоково: образцы сериализуются по одному
+            chunks = stream_analysis(result, samples)
             if args.output:
                 output_path = Path(args.output)
-                if args.format == 'json':
-                    with open(output_path, 'w', encoding='utf-8') as f:
-                        json.dump(result, f, ensure_ascii=False, indent=2)
-                else:
-                    with open(output_path, 'w', encoding='utf-8') as f:
-                        f.write(formatted_output)
-                logger.info(f"Результаты сохранены в {output_path}")
+                with open(output_path, 'wb') as f:
+                    for chunk in chunks:
+                        f.write(chunk)
+                self.logger.info("Результаты сохранены в %s", output_path)
             else:
-                print(formatted_output)
-                
+                for chunk in chunks:
+                    sys.stdout.buffer.write(chunk)
+                sys.stdout.flush()
         else:
-            print("Укажите команду. Используйте --help для справки.")
-            
+            result["samples"] = samples
+            if args.output:
+                output_path = Path(args.output)
+                with open(output_path, 'w', encoding='utf-8') as f:
+                    f.write(format_output(result, args.format, args.pretty))
+                self.logger.info("Результаты сохранены в %s", output_path)
+            else:
+                print(format_output(result, args.format, args.pretty))
+
+# Экземпляр CliApp, общий для повторных вызовов main() в одном процессе (например, из REPL)
+_app: Optional[CliApp] = None
+
+def get_app() -> CliApp:
+    global _app
+    if _app is None:
+        _app = CliApp()
+    return _app
+
+def main():
+    args = parse_args()
+    if args.command is None:
+        print("Укажите команду. Используйте --help для справки.")
+        return
+    
+    try:
+        app = get_app()
+        getattr(app, f"cmd_{args.command}")(args)
     except Exception as e:
         logger.exception("Произошла критическая ошибка")
         print(f"Ошибка: {str(e)}")
         raise
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -1,16 +1,40 @@
+import os
 import sys
-import json
 import random
-from typing import List, Dict, Any
+import atexit
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Dict, Any, Optional
 from qdrant_client import QdrantClient
 from qdrant_client.http import models
 
-QDRANT_HOST = "localhost"
-QDRANT_PORT = 6333
+from database.qdrant_client import (
+    point_ids_cache_path, scroll_point_ids, load_point_ids_cache, save_point_ids_cache,
+    invalidate_point_ids_cache
+)
+from utils.serialization import dumps_json
 
+# Параметры подключения можно переопределить переменными окружения; по умолчанию gRPC,
+# QDRANT_PREFER_GRPC=0 возвращает REST
+QDRANT_HOST = os.environ.get("QDRANT_HOST", "localhost")
+QDRANT_PORT = int(os.environ.get("QDRANT_PORT", 6333))
+QDRANT_GRPC_PORT = int(os.environ.get("QDRANT_GRPC_PORT", 6334))
+QDRANT_PREFER_GRPC = os.environ.get("QDRANT_PREFER_GRPC", "1").lower() not in ("0", "false", "no")
+QDRANT_POOL_SIZE = 100
+
+@lru_cache(maxsize=1)
 def get_client() -> QdrantClient:
-    """Инициализирует и возвращает клиент Qdrant"""
-    return QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT)
+    """Возвращает общий для процесса клиент Qdrant; соединения переиспользуются между вызовами"""
+    client = QdrantClient(
+        host=QDRANT_HOST,
+        port=QDRANT_PORT,
+        grpc_port=QDRANT_GRPC_PORT,
+        prefer_grpc=QDRANT_PREFER_GRPC,
+        pool_size=QDRANT_POOL_SIZE,
+        timeout=60
+    )
+    atexit.register(client.close)
+    return client
 
 def list_collections() -> List[str]:
     """Получает список всех коллекций"""
@@ -35,28 +59,47 @@ def get_collection_info(collection_name: str) -> Dict[str, Any]:
     except Exception as e:
         return {"error": str(e)}
 
+# Кэш ID точек по коллекциям: случайная выборка делается по нему, без прохода по коллекции со смещением.
+# Список также сохраняется на диск тем же кодом, что и в QdrantManager
+_point_ids_cache: Dict[str, List] = {}
+
+def _point_ids_cache_path(collection_name: str) -> Path:
+    return point_ids_cache_path(QDRANT_HOST, QDRANT_PORT, collection_name)
+
+def get_point_ids(collection_name: str) -> List:
+    """Получает (и кэширует) список ID всех точек коллекции, без payload и векторов"""
+    if collection_name not in _point_ids_cache:
+        client = get_client()
+        points_count = client.get_collection(collection_name).points_count
+        cache_path = _point_ids_cache_path(collection_name)
+        point_ids = load_point_ids_cache(cache_path, points_count)
+        if point_ids is None:
+            point_ids = scroll_point_ids(client, collection_name)
+            save_point_ids_cache(cache_path, points_count, point_ids)
+        _point_ids_cache[collection_name] = point_ids
+    return _point_ids_cache[collection_name]
+
 def get_random_points(collection_name: str, count: int = 5) -> List[Dict]:
     """Получает случайные точки из коллекции"""
     client = get_client()
     
     try:
-        # Получаем общее количество точек
-        collection_info = client.get_collection(collection_name)
-        total_points = collection_info.points_count
-        
-        if total_points == 0:
+        point_ids = get_point_ids(collection_name)
+        if not point_ids:
             return []
         
-        # Получаем случайное смещение
-        offset = random.randint(0, max(1, total_points - count))
-        
-        # Получаем точки
-        points, _ = client.scroll(
+        # Выбираем случайные ID и получаем точки напрямую
+        sample_ids = random.sample(point_ids, min(count, len(point_ids)))
+        points = client.retrieve(
             collection_name=collection_name,
-            offset=offset,
-            limit=min(count, total_points),
-            with_payload=True
+            ids=sample_ids,
+            with_payload=True,
+            with_vectors=False
         )
+        if len(points) < len(sample_ids):
+            # Часть ID уже удалена: сохраненный список устарел и при следующем вызове строится заново
+            _point_ids_cache.pop(collection_name, None)
+            invalidate_point_ids_cache(_point_ids_cache_path(collection_name))
         
         # Форматируем результат
         result = []
@@ -71,16 +114,39 @@ def get_random_points(collection_name: str, count: int = 5) -> List[Dict]:
     except Exception as e:
         return [{"error": str(e)}]
 
+# Поля, по которым фильтруют и считают facet; индексы по ним создаются командой index.
+# metadata.title тоже индексируется как KEYWORD, а не TEXT: фильтр и facet сравнивают значение целиком
+FILTER_INDEX_FIELDS = ("metadata.type", "metadata.article_number", "metadata.title")
+
+def create_payload_indexes(collection_name: str, field_names: List[str]) -> List[str]:
+    """Создает keyword-индексы по полям payload, которых еще нет; возвращает созданные поля"""
+    client = get_client()
+    existing = client.get_collection(collection_name).payload_schema
+    created = []
+    for field_name in field_names:
+        if field_name in existing:
+            continue
+        client.create_payload_index(
+            collection_name=collection_name,
+            field_name=field_name,
+            field_schema=models.PayloadSchemaType.KEYWORD
+        )
+        created.append(field_name)
+    return created
+
 def count_by_filter(collection_name: str, filter_field: str, filter_value: str) -> int:
     """Подсчет точек по фильтру"""
     client = get_client()
     
     try:
+        # Без индекса Qdrant проверяет фильтр по payload каждой точки; индекс создается командой index
+        field_name = f"metadata.{filter_field}"
+        
         # Создаем фильтр
         filter_query = models.Filter(
             must=[
                 models.FieldCondition(
-                    key=f"metadata.{filter_field}",
+                    key=field_name,
                     match=models.MatchValue(value=filter_value)
                 )
             ]
@@ -97,27 +163,87 @@ def count_by_filter(collection_name: str, filter_field: str, filter_value: str)
         print(f"Ошибка: {str(e)}")
         return 0
 
-def perform_search(collection_name: str, query_vector: List[float], limit: int = 5):
+def _build_query_request(query_vector: List[float], limit: int, hnsw_ef: Optional[int] = None,
+                         prefetch_multiplier: Optional[int] = None,
+                         score_threshold: Optional[float] = None) -> models.QueryRequest:
+    """Запрос Query API: hnsw_ef и опционально двухэтапный поиск с переоценкой кандидатов"""
+    if not prefetch_multiplier:
+        return models.QueryRequest(
+            query=query_vector,
+            limit=limit,
+            params=models.SearchParams(hnsw_ef=hnsw_ef, exact=False) if hnsw_ef else None,
+            score_threshold=score_threshold,
+            with_payload=True
+        )
+    
+    # Первый этап: limit * prefetch_multiplier кандидатов по HNSW только на квантованных векторах (дешево);
+    # второй: кандидаты переоцениваются по исходным векторам и отбираются лучшие limit
+    prefetch = models.Prefetch(
+        query=query_vector,
+        limit=limit * prefetch_multiplier,
+        params=models.SearchParams(
+            hnsw_ef=hnsw_ef,
+            exact=False,
+            quantization=models.QuantizationSearchParams(rescore=False)
+        )
+    )
+    return models.QueryRequest(
+        query=query_vector,
+        limit=limit,
+        prefetch=[prefetch],
+        params=models.SearchParams(quantization=models.QuantizationSearchParams(ignore=True)),
+        score_threshold=score_threshold,
+        with_payload=True
+    )
+
+def _format_points(points) -> List[Dict]:
+    """Форматирует найденные точки"""
+    return [
+        {
+            "id": point.id,
+            "score": point.score,
+            "payload": point.payload
+        }
+        for point in points
+    ]
+
+def perform_search_batch(collection_name: str, query_vectors: List[List[float]], limit: int = 5,
+                         hnsw_ef: Optional[int] = None, prefetch_multiplier: Optional[int] = None,
+                         score_threshold: Optional[float] = None) -> List[List[Dict]]:
+    """Выполняет поиск по нескольким векторам одним запросом, результаты в порядке векторов"""
+    client = get_client()
+    
+    try:
+        requests = [
+            _build_query_request(query_vector, limit, hnsw_ef, prefetch_multiplier, score_threshold)
+            for query_vector in query_vectors
+        ]
+        responses = client.query_batch_points(
+            collection_name=collection_name,
+            requests=requests
+        )
+        return [_format_points(response.points) for response in responses]
+    except Exception as e:
+        return [[{"error": str(e)}] for _ in query_vectors]
+
+def perform_search(collection_name: str, query_vector: List[float], limit: int = 5,
+                   hnsw_ef: Optional[int] = None, prefetch_multiplier: Optional[int] = None,
+                   score_threshold: Optional[float] = None):
     """Выполняет поиск по вектору"""
     client = get_client()
     
     try:
-        results = client.search(
+        request = _build_query_request(query_vector, limit, hnsw_ef, prefetch_multiplier, score_threshold)
+        response = client.query_points(
             collection_name=collection_name,
-            query_vector=query_vector,
-            limit=limit
+            query=request.query,
+            limit=request.limit,
+            prefetch=request.prefetch,
+            search_params=request.params,
+            score_threshold=request.score_threshold,
+            with_payload=True
         )
-        
-        # Форматируем результат
-        search_results = []
-        for result in results:
-            search_results.append({
-                "id": result.id,
-                "score": result.score,
-                "payload": result.payload
-            })
-            
-        return search_results
+        return _format_points(response.points)
     except Exception as e:
         return [{"error": str(e)}]
 
@@ -131,13 +257,13 @@ def main():
     if command == "collections":
         # Получаем список коллекций
         collections = list_collections()
-        print(json.dumps(collections, indent=2))
+        print(dumps_json(collections).decode('utf-8'))
     
     elif command == "info" and len(sys.argv) >= 3:
         # Получаем информацию о коллекции
         collection_name = sys.argv[2]
         info = get_collection_info(collection_name)
-        print(json.dumps(info, indent=2))
+        print(dumps_json(info).decode('utf-8'))
     
     elif command == "count" and len(sys.argv) >= 3:
         # Получаем количество точек
@@ -150,7 +276,7 @@ def main():
         collection_name = sys.argv[2]
         count = int(sys.argv[3])
         points = get_random_points(collection_name, count)
-        print(json.dumps(points, indent=2))
+        print(dumps_json(points).decode('utf-8'))
     
     elif command == "filter" and len(sys.argv) >= 5:
         # Подсчет по фильтру
@@ -160,6 +286,13 @@ def main():
         count = count_by_filter(collection_name, filter_field, filter_value)
         print(f"Количество точек с {filter_field}={filter_value}: {count}")
     
+    elif command == "index" and len(sys.argv) >= 3:
+        # Создание keyword-индексов по полям фильтров (по умолчанию FILTER_INDEX_FIELDS)
+        collection_name = sys.argv[2]
+        field_names = [f"metadata.{field}" for field in sys.argv[3:]] or list(FILTER_INDEX_FIELDS)
+        created = create_payload_indexes(collection_name, field_names)
+        print(f"Созданы индексы: {', '.join(created) if created else 'нет (все уже существуют)'}")
+    
     else:
         print("Неизвестная команда или недостаточно аргументов")
         print("Использование:")
@@ -168,6 +301,7 @@ def main():
         print("  python qdrant_utility.py count <collection_name>")
         print("  python qdrant_utility.py sample <collection_name> <count>")
         print("  python qdrant_utility.py filter <collection_name> <field> <value>")
+        print("  python qdrant_utility.py index <collection_name> [field ...]")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
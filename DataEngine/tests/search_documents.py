@@ -1,30 +1,28 @@
 import argparse
+from typing import Optional
 from database.qdrant_client import QdrantManager
 from embeddings.embedder import Embedder
 from search.document_search import LegalDocumentSearch
 from utils.config_loader import load_config
-from utils.logger import setup_logging
+from utils.logger import setup_logging, logger
+
+# Шаблоны вывода результата поиска для статей и остальных фрагментов
+ARTICLE_TMPL = "\nСтатья {article_num} ({doc_title})\nРелевантность: {score:.2f}\nТекст: {text}\nID: {id}\n"
+SECTION_TMPL = "\n{doc_title}\nРелевантность: {score:.2f}\nТекст: {text}\nID: {id}\n"
 
 def format_search_result(result, max_text_length=300):
     """Форматирует результат поиска для вывода в терминал"""
     text = result['text']
+    metadata = result['metadata']
+    doc_title = metadata.get('doc_title') or metadata.get('title') or 'Без названия'
+    
     if len(text) > max_text_length:
         text = text[:max_text_length] + "..."
     
-    metadata = result['metadata']
-    doc_title = metadata.get('doc_title', metadata.get('title', 'Без названия'))
-    
     if metadata.get('type') == 'article':
-        article_num = metadata.get('article_number', '')
-        return (f"\nСтатья {article_num} ({doc_title})\n"
-                f"Релевантность: {result['score']:.2f}\n"
-                f"Текст: {text}\n"
-                f"ID: {result['id']}\n")
-    else:
-        return (f"\n{doc_title}\n"
-                f"Релевантность: {result['score']:.2f}\n"
-                f"Текст: {text}\n"
-                f"ID: {result['id']}\n")
+        return ARTICLE_TMPL.format(article_num=metadata.get('article_number', ''), doc_title=doc_title,
+                                   score=result['score'], text=text, id=result['id'])
+    return SECTION_TMPL.format(doc_title=doc_title, score=result['score'], text=text, id=result['id'])
 
 def parse_args():
     parser = argparse.ArgumentParser(description='Поиск юридических документов')
@@ -36,6 +34,10 @@ def parse_args():
     search_parser.add_argument('--limit', type=int, default=5, help='Количество результатов')
     search_parser.add_argument('--threshold', type=float, default=0.7, 
                               help='Минимальный порог релевантности (0-1)')
+    search_parser.add_argument('--hnsw-ef', type=int, default=64,
+                              help='Размер списка кандидатов HNSW; меньше — быстрее, но ниже полнота')
+    search_parser.add_argument('--rescore', action=argparse.BooleanOptionalAction, default=True,
+                              help='Переранжировать кандидатов по исходным векторам (сохраняет полноту при малом --hnsw-ef)')
     
     keywords_parser = subparsers.add_parser('keywords', help='Поиск по ключевым словам')
     keywords_parser.add_argument('keywords', type=str, nargs='+', help='Ключевые слова')
@@ -43,60 +45,75 @@ def parse_args():
     
     return parser.parse_args()
 
-def main():
-    args = parse_args()
-    logger = setup_logging()
-    logger.info("Запуск системы поиска документов")
+class CliApp:
+    """Общее состояние CLI: логирование, конфигурация, клиент Qdrant и модель эмбеддингов создаются один раз"""
     
-    try:
-        config = load_config()
-        logger.info("Конфигурация загружена успешно")
-
-        qdrant = QdrantManager(config.qdrant)
-        logger.info("Qdrant клиент инициализирован")
-
-        embedder = Embedder(config.embeddings)
-        logger.info("Embedder инициализирован")
+    def __init__(self):
+        self.logger = setup_logging()
+        self.logger.info("Запуск системы поиска документов")
         
-        search_service = LegalDocumentSearch(embedder, qdrant)
-        logger.info("Сервис поиска инициализирован")
+        self.config = load_config()
+        self.logger.info("Конфигурация загружена успешно")
         
-        if args.command == 'search':
-            print(f"\nПоиск по запросу: '{args.query}'")
-            results = search_service.search(
-                args.query, 
-                limit=args.limit,
-                threshold=args.threshold
-            )
-            
-            if not results:
-                print("\nНе найдено подходящих документов")
-            else:
-                print(f"\nНайдено результатов: {len(results)}")
-                for result in results:
-                    print(format_search_result(result))
-                    
-        elif args.command == 'keywords':
-            print(f"\nПоиск по ключевым словам: {args.keywords}")
-            results = search_service.search_by_keywords(
-                args.keywords, 
-                limit=args.limit
-            )
-            
-            if not results:
-                print("\nНе найдено подходящих документов")
-            else:
-                print(f"\nНайдено результатов: {len(results)}")
-                for result in results:
-                    print(format_search_result(result))
-
+        self.qdrant = QdrantManager(self.config.qdrant)
+        self.logger.info("Qdrant клиент инициализирован")
+        
+        self.embedder = Embedder(self.config.embeddings)
+        self.logger.info("Embedder инициализирован")
+        
+        self.search_service = LegalDocumentSearch(self.embedder, self.qdrant)
+        self.logger.info("Сервис поиска инициализирован")
+    
+    def cmd_search(self, args):
+        print(f"\nПоиск по запросу: '{args.query}'")
+        results = self.search_service.search(
+            args.query, 
+            limit=args.limit,
+            threshold=args.threshold,
+            hnsw_ef=args.hnsw_ef,
+            rescore=args.rescore
+        )
+        self._print_results(results)
+    
+    def cmd_keywords(self, args):
+        print(f"\nПоиск по ключевым словам: {args.keywords}")
+        results = self.search_service.search_by_keywords(
+            args.keywords, 
+            limit=args.limit
+        )
+        self._print_results(results)
+    
+    @staticmethod
+    def _print_results(results):
+        if not results:
+            print("\nНе найдено подходящих документов")
         else:
-            print("\nУкажите команду. Используйте --help для справки")
-            
+            print(f"\nНайдено результатов: {len(results)}")
+            for result in results:
+                print(format_search_result(result))
+
+# Экземпляр CliApp, общий для повторных вызовов main() в одном процессе (например, из REPL)
+_app: Optional[CliApp] = None
+
+def get_app() -> CliApp:
+    global _app
+    if _app is None:
+        _app = CliApp()
+    return _app
+
+def main():
+    args = parse_args()
+    if args.command is None:
+        print("\nУкажите команду. Используйте --help для справки")
+        return
+    
+    try:
+        app = get_app()
+        getattr(app, f"cmd_{args.command}")(args)
     except Exception as e:
         logger.exception("Произошла критическая ошибка")
         print(f"Ошибка: {str(e)}")
         raise
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
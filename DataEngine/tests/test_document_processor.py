@@ -0,0 +1,24 @@
+import pytest
+
+from data_processing import document_processor
+from data_processing.document_processor import LegalTextProcessor
+
+KEYWORD_TEXTS = [
+    "Правоотношения сторон по договору; обязательство и обязательства, исковая давность, иск.",
+    "Субъект права собственности на имущество (ст. 209, п. 2) - правоспособность и дееспособность.",
+    "НАСЛЕДОВАНИЕ и наследство, залог, сервитут, возмещение ущерба и компенсация.",
+]
+
+
+@pytest.mark.skipif(document_processor.ahocorasick is None, reason="pyahocorasick не установлен")
+@pytest.mark.parametrize("text", KEYWORD_TEXTS, ids=["overlapping", "abbreviations", "case"])
+def test_keyword_backends_agree(monkeypatch, text):
+    """Ахо-Корасик и регулярное выражение возвращают одинаковый набор ключевых терминов"""
+    processor = LegalTextProcessor([])
+    with_automaton = sorted(processor._extract_keywords(text))
+    
+    monkeypatch.setattr(LegalTextProcessor, "_KEYWORD_AUTOMATON", None)
+    with_regex = sorted(processor._extract_keywords(text))
+    
+    assert with_automaton == with_regex
+    assert with_automaton
@@ -0,0 +1,42 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+ENGINE_DIR = Path(__file__).resolve().parents[1]
+
+WORKER_SCRIPT = '''
+import logging
+import multiprocessing
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from utils.logger import setup_logging, setup_worker_logging, get_log_queue
+
+def work(i):
+    logging.getLogger("utils.logger").error("worker line %s", i)
+    return i
+
+if __name__ == "__main__":
+    # Способ запуска по умолчанию задается до setup_logging, как на платформе с таким способом
+    multiprocessing.set_start_method(sys.argv[1])
+    setup_logging()
+    with ProcessPoolExecutor(max_workers=2, initializer=setup_worker_logging,
+                             initargs=(get_log_queue(),)) as executor:
+        list(executor.map(work, range(3)))
+'''
+
+
+@pytest.mark.parametrize("start_method", ["fork", "spawn"])
+def test_pool_worker_records_reach_log_file(tmp_path, start_method):
+    """Записи рабочих процессов пула попадают в файл лога основного процесса"""
+    script = tmp_path / "worker_logging.py"
+    script.write_text(WORKER_SCRIPT, encoding="utf-8")
+    env = {**os.environ, "PYTHONPATH": str(ENGINE_DIR)}
+    
+    subprocess.run([sys.executable, str(script), start_method], cwd=tmp_path, env=env, check=True, timeout=60)
+    
+    log_text = (tmp_path / "logs" / "legal_rag.log").read_text(encoding="utf-8")
+    for i in range(3):
+        assert f"[ERROR] worker line {i}" in log_text
@@ -1,14 +1,28 @@
+from functools import lru_cache
 from pathlib import Path
+from typing import Optional
 import yaml
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
+
+# C-реализация загрузчика (libyaml), если PyYAML собран с ней
+try:
+    _YamlLoader = yaml.CSafeLoader
+except AttributeError:
+    _YamlLoader = yaml.SafeLoader
 
 class QdrantConfig(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     host: str
     port: int
+    grpc_port: int = 6334
+    prefer_grpc: bool = True
     collection_name: str
     vector_size: int
 
 class ProcessingConfig(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     chunk_size: int
     chunk_overlap: int
     allowed_extensions: list[str]
@@ -16,16 +30,27 @@ class ProcessingConfig(BaseModel):
     legal_text: dict = {}
 
 class EmbeddingsConfig(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     model_name: str
     device: str
     batch_size: int
+    backend: str = 'torch'
+    model_file: Optional[str] = None
 
 class AppConfig(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     qdrant: QdrantConfig
     processing: ProcessingConfig
     embeddings: EmbeddingsConfig
 
 def load_config(config_path: Path = Path("config/config.yaml")) -> AppConfig:
-    with open(config_path) as f:
-        config_data = yaml.safe_load(f)
-    return AppConfig(**config_data) 
\ No newline at end of file
+    # Конфигурация неизменяема, поэтому один и тот же файл разбирается только один раз за процесс
+    return _load_config_cached(str(Path(config_path).resolve()))
+
+@lru_cache(maxsize=4)
+def _load_config_cached(config_path: str) -> AppConfig:
+    with open(config_path, 'rb') as f:
+        config_data = yaml.load(f, Loader=_YamlLoader)
+    return AppConfig(**config_data)
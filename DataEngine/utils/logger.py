@@ -1,20 +1,82 @@
+import atexit
 import logging
+import logging.handlers
+import multiprocessing
+import os
 from pathlib import Path
 import sys
 
 # Инициализируем корневой логгер
 logger = logging.getLogger(__name__)
 
+# Ротация файла логов: максимальный размер одного файла (байт) и число хранимых архивов
+LOG_FILE_MAX_BYTES = 10 * 1024 * 1024
+LOG_FILE_BACKUP_COUNT = 5
+
+_listener = None
+_log_queue = None
+
+def _log_level() -> int:
+    # Уровень по умолчанию INFO; DEBUG включается переменной окружения LOG_LEVEL
+    level = logging.getLevelName(os.environ.get('LOG_LEVEL', 'INFO').upper())
+    return level if isinstance(level, int) else logging.INFO
+
 def setup_logging():
+    global _listener
+    if _listener is not None:
+        return logger
+    
     logs_dir = Path('logs')
     logs_dir.mkdir(exist_ok=True)
     
+    level = _log_level()
+    
+    formatter = logging.Formatter('%(asctime)s [%(levelname)s] %(message)s')
+    
+    # Запись в файл выполняется фоновым потоком QueueListener, вызывающий код только кладет запись в очередь
+    file_handler = logging.handlers.RotatingFileHandler(
+        logs_dir / 'legal_rag.log',
+        maxBytes=LOG_FILE_MAX_BYTES,
+        backupCount=LOG_FILE_BACKUP_COUNT,
+        encoding='utf-8'
+    )
+    file_handler.setFormatter(formatter)
+    # Очередь межпроцессная: рабочие процессы пулов пишут в нее же, а в файл пишет только listener
+    log_queue = multiprocessing.Queue()
+    queue_handler = _make_queue_handler(log_queue)
+    
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(formatter)
+    
     logging.basicConfig(
-        level=logging.DEBUG,
-        format='%(asctime)s [%(levelname)s] %(message)s',
-        handlers=[
-            logging.FileHandler(logs_dir / 'legal_rag.log'),
-            logging.StreamHandler(sys.stdout)
-        ]
+        level=level,
+        handlers=[queue_handler, stream_handler]
     )
-    return logger 
\ No newline at end of file
+    
+    global _log_queue
+    _log_queue = log_queue
+    _listener = logging.handlers.QueueListener(log_queue, file_handler)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return logger
+
+def _make_queue_handler(log_queue) -> logging.handlers.QueueHandler:
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    # Сообщение (и traceback) подставляется до постановки в очередь, время и уровень добавляет file_handler
+    queue_handler.setFormatter(logging.Formatter('%(message)s'))
+    return queue_handler
+
+def get_log_queue():
+    """Очередь логов основного процесса (None, если setup_logging не вызывался) — для initargs пулов"""
+    return _log_queue
+
+def setup_worker_logging(log_queue):
+    """Подключает рабочий процесс пула к очереди логов основного процесса"""
+    if log_queue is None:
+        return
+    root = logging.getLogger()
+    # При fork обработчик очереди уже унаследован от родителя
+    if any(isinstance(h, logging.handlers.QueueHandler) and h.queue is log_queue for h in root.handlers):
+        return
+    root.addHandler(_make_queue_handler(log_queue))
+    root.setLevel(_log_level())
@@ -0,0 +1,34 @@
+import dataclasses
+import datetime
+import uuid
+from typing import Any
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    import json
+    orjson = None
+
+
+def _json_default(value: Any):
+    # Запасной путь без orjson: приводит к JSON те же типы, что orjson сериализует сам
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return dataclasses.asdict(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps_json(data: Any) -> bytes:
+    """Сериализует данные в JSON (UTF-8, без экранирования не-ASCII) с отступами; orjson, если установлен"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(data, ensure_ascii=False, indent=2, default=_json_default).encode('utf-8')
@@ -0,0 +1,9 @@
+import os
+
+
+def available_cpu_count() -> int:
+    """Число ядер, доступных текущему процессу (с учетом ограничений affinity/контейнера)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1